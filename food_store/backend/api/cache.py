@@ -0,0 +1,268 @@
+import functools
+import hashlib
+import time
+from calendar import timegm
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import record_cache_outcome
+from .models import CatalogVersion
+
+VERSION_KEY = 'catalog:version:{}'
+MODIFIED_KEY = 'catalog:modified:{}'
+RESPONSE_KEY = 'catalog:response:{}:{}'
+STATS_KEY = 'catalog:stats:{}'
+
+
+def _version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def _memoize(request, key, compute):
+    """Вычисляет значение один раз за запрос (без запроса — каждый раз)."""
+    if request is None:
+        return compute()
+    memo = request.__dict__.setdefault('_catalog_state', {})
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def _read_table_versions(labels):
+    return {
+        label: (version, modified_at)
+        for label, version, modified_at in CatalogVersion.objects.filter(
+            label__in=labels
+        ).values_list('label', 'version', 'modified_at')
+    }
+
+
+def _table_versions(models, request=None):
+    """
+    Возвращает (версия, время изменения) таблиц из CatalogVersion одним
+    запросом по первичному ключу; за запрос каждая таблица читается один
+    раз. Отсутствующие строки создаются с версией из текущего времени.
+    """
+    labels = [model._meta.label_lower for model in models]
+    rows = (
+        {} if request is None
+        else request.__dict__.setdefault('_catalog_tables', {})
+    )
+    missing = [label for label in labels if label not in rows]
+    if missing:
+        found = _read_table_versions(missing)
+        absent = [label for label in missing if label not in found]
+        if absent:
+            CatalogVersion.objects.bulk_create(
+                [
+                    CatalogVersion(label=label, version=time.time_ns(),
+                                   modified_at=timezone.now())
+                    for label in absent
+                ],
+                ignore_conflicts=True
+            )
+            found.update(_read_table_versions(absent))
+        rows.update(found)
+    return [rows[label] for label in labels]
+
+
+def get_versions(models, request=None):
+    """
+    Возвращает текущие версии таблиц моделей.
+
+    Если кэш общий для процессов (CATALOG_CACHE_SHARED), версии хранятся
+    в нем и увеличиваются сигналами. Отсутствующая версия
+    инициализируется текущим временем, а не единицей, чтобы после
+    вытеснения ключа из кэша не воскресли старые ответы.
+
+    С кэшем процесса (locmem) версия, увеличенная в одном воркере, не
+    видна другим, поэтому версии хранятся в таблице CatalogVersion.
+    """
+    if not settings.CATALOG_CACHE_SHARED:
+        return [version for version, _ in _table_versions(models, request)]
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def request_versions(request, models):
+    """Версии таблиц строкой, вычисленные один раз за запрос."""
+    return _memoize(request, ('versions', models), lambda: '.'.join(
+        str(version) for version in get_versions(models, request)
+    ))
+
+
+def _bump_table_version(model):
+    label = model._meta.label_lower
+    versions = CatalogVersion.objects.filter(label=label)
+    values = {'version': F('version') + 1, 'modified_at': timezone.now()}
+    if versions.update(**values):
+        return
+    try:
+        with transaction.atomic():
+            CatalogVersion.objects.create(
+                label=label, version=time.time_ns(),
+                modified_at=values['modified_at']
+            )
+    except IntegrityError:
+        versions.update(**values)
+
+
+def bump_version(model):
+    """Инвалидирует все закэшированные ответы, зависящие от модели."""
+    if not settings.CATALOG_CACHE_SHARED:
+        _bump_table_version(model)
+        return
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY.format(model._meta.label_lower), int(time.time()),
+              timeout=None)
+
+
+def get_last_modified(models, request=None):
+    """
+    Возвращает время последнего изменения таблиц моделей (unix timestamp).
+
+    Время обновляется вместе с версией таблицы. В общем кэше при холодном
+    кэше оно вычисляется один раз агрегатом Max(updated_at) по индексу.
+    """
+    if not settings.CATALOG_CACHE_SHARED:
+        return max(
+            timegm(modified_at.utctimetuple())
+            for _, modified_at in _table_versions(models, request)
+        )
+    keys = {MODIFIED_KEY.format(model._meta.label_lower): model
+            for model in models}
+    timestamps = cache.get_many(keys)
+    for key, model in keys.items():
+        if key in timestamps:
+            continue
+        last = model.objects.aggregate(last=Max('updated_at'))['last']
+        timestamp = timegm(last.utctimetuple()) if last else 0
+        cache.add(key, timestamp, timeout=None)
+        timestamps[key] = cache.get(key, timestamp)
+    return max(timestamps.values(), default=0)
+
+
+def _record(outcome):
+    record_cache_outcome(outcome)
+    key = STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    """
+    Возвращает счетчики попаданий и промахов кэша ответов каталога в
+    кэше default (при locmem — только текущего процесса). По маршрутам
+    они же публикуются на /metrics (food_store_catalog_cache_requests_total).
+    """
+    keys = {outcome: STATS_KEY.format(outcome) for outcome in ('hit', 'miss')}
+    values = cache.get_many(keys.values())
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+def build_cache_key(request, models):
+    """
+    Строит ключ ответа по полному URL запроса (путь, параметры и страница)
+    и версиям таблиц, от которых зависит ответ.
+    """
+    url_hash = hashlib.sha256(
+        request.build_absolute_uri().encode()
+    ).hexdigest()
+    return RESPONSE_KEY.format(url_hash, request_versions(request, models))
+
+
+def cache_response(*models):
+    """
+    Декоратор действий ViewSet, кэширующий данные успешных ответов.
+
+    Ответ хранится до изменения любой из переданных моделей: после коммита
+    изменения сигналы увеличивают версию таблицы, и ключи со старой
+    версией перестают использоваться. Профилируемые запросы
+    (request.is_profiled) выполняются без кэша.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if getattr(request, 'is_profiled', False):
+                response = view_method(self, request, *args, **kwargs)
+                response['X-Cache'] = 'BYPASS'
+                return response
+            key = build_cache_key(request, models)
+            cached = cache.get(key)
+            if cached is not None:
+                _record('hit')
+                response = Response(cached)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _record('miss')
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data,
+                          timeout=settings.CATALOG_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_response(*models):
+    """
+    Декоратор действий ViewSet с поддержкой условных GET-запросов.
+
+    ETag строится из URL запроса, заголовка Accept и версий таблиц, а
+    Last-Modified берется из времени изменения таблиц, поэтому ответ 304
+    отдается без обращения к сериализатору и, как правило, к базе (без
+    общего кэша — одним запросом версий таблиц). Профилируемые запросы
+    всегда получают полный ответ.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if getattr(request, 'is_profiled', False):
+                return view_method(self, request, *args, **kwargs)
+            versions = request_versions(request, models)
+            etag = quote_etag(hashlib.sha256('|'.join((
+                request.build_absolute_uri(),
+                request.META.get('HTTP_ACCEPT', ''),
+                versions,
+            )).encode()).hexdigest())
+            last_modified = _memoize(
+                request, ('modified', models),
+                lambda: get_last_modified(models, request)
+            )
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK,
+                                        status.HTTP_304_NOT_MODIFIED):
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified',
+                                            http_date(last_modified))
+                response.headers.setdefault('Vary', 'Accept')
+            return response
+        return wrapper
+    return decorator
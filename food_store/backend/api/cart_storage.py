@@ -0,0 +1,535 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .serializers import CompactCartItemSerializer
+from products.models import Cart, CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+GUEST_SESSION_KEY = 'guest_cart_key'
+PURGE_BATCH_SIZE = 1000
+
+
+def get_storage_class():
+    """Возвращает класс хранилища корзин по настройке CART_STORAGE."""
+    return import_string(settings.CART_STORAGE)
+
+
+def get_cart_storage(request, create=True):
+    """
+    Возвращает хранилище корзины автора запроса.
+
+    Для анонимного посетителя корзина привязывается к случайному ключу,
+    который хранится в его сессии (cookie). Если ключа еще нет и
+    create=False, возвращает None, не создавая сессию.
+    """
+    storage_class = get_storage_class()
+    if request.user.is_authenticated:
+        return storage_class(user=request.user)
+
+    guest_key = request.session.get(GUEST_SESSION_KEY)
+    if guest_key is None:
+        if not create:
+            return None
+        guest_key = uuid.uuid4().hex
+        request.session[GUEST_SESSION_KEY] = guest_key
+    return storage_class(guest_key=guest_key)
+
+
+def merge_guest_cart(request, user):
+    """
+    Переносит гостевую корзину из сессии в корзину пользователя.
+
+    Товары добавляются одним пакетным upsert, поэтому время входа не
+    зависит от размера корзины.
+    """
+    guest_key = request.session.pop(GUEST_SESSION_KEY, None)
+    if guest_key is None:
+        return
+    storage_class = get_storage_class()
+    storage_class(user=user).merge(storage_class(guest_key=guest_key))
+
+
+def _cart_items(compact):
+    if compact:
+        return CartItem.objects.select_related('product').only(
+            *CompactCartItemSerializer.Meta.columns
+        )
+    return CartItem.objects.select_related(
+        'product__category', 'product__subcategory'
+    )
+
+
+class CartSnapshot:
+    """
+    Состояние корзины, собранное не из базы, в виде, пригодном для
+    CartSerializer: id, user, items и итоги total_quantity/total_price.
+    """
+
+    def __init__(self, cart_id, user, items):
+        self.id = cart_id
+        self.user = user
+        self.items = items
+        self.total_quantity = sum(item.quantity for item in items)
+        self.total_price = sum(
+            item.quantity * item.product.price for item in items
+        )
+
+
+class BaseCartStorage:
+    """
+    Интерфейс хранилища корзины, которым пользуется CartViewSet.
+
+    Количества передаются словарями {id продукта: количество}.
+    """
+
+    def __init__(self, user=None, guest_key=None):
+        self.user = user
+        self.guest_key = guest_key
+        self.owner = (
+            {'user': user} if user is not None else {'guest_key': guest_key}
+        )
+
+    def get_cart(self, compact=False):
+        """Возвращает корзину с товарами и итогами для сериализации."""
+        raise NotImplementedError
+
+    def add(self, quantities):
+        """Увеличивает количества товаров, добавляя отсутствующие."""
+        raise NotImplementedError
+
+    def set(self, quantities):
+        """Устанавливает количества товаров, добавляя отсутствующие."""
+        raise NotImplementedError
+
+    def update(self, product_id, quantity):
+        """
+        Устанавливает количество товара, только если он уже в корзине.
+        Возвращает True, если товар найден.
+        """
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        """Удаляет товары и возвращает число удаленных позиций."""
+        raise NotImplementedError
+
+    def clear(self):
+        """Очищает корзину и возвращает число удаленных позиций."""
+        raise NotImplementedError
+
+    def quantities(self):
+        """Возвращает содержимое корзины: {id продукта: количество}."""
+        raise NotImplementedError
+
+    def discard(self):
+        """Удаляет корзину целиком."""
+        raise NotImplementedError
+
+    def merge(self, other):
+        """Добавляет товары корзины other в эту корзину и удаляет other."""
+        quantities = other.quantities()
+        if quantities:
+            self.add(quantities)
+        other.discard()
+
+    def apply(self, adds, sets, removes):
+        """Применяет итоговые изменения пакета операций."""
+        self.remove(removes)
+        self.set(sets)
+        self.add(adds)
+
+    def flush(self):
+        """Сохраняет отложенные изменения в базу."""
+
+    @classmethod
+    def purge_guest_carts(cls, before):
+        """
+        Удаляет гостевые корзины, не изменявшиеся с момента before, и
+        возвращает их число. Ключ такой корзины хранился в сессии
+        посетителя, которая к этому времени истекла, поэтому без очистки
+        корзина осталась бы в базе навсегда.
+        """
+        carts = Cart.objects.filter(guest_key__isnull=False,
+                                    updated_at__lt=before)
+        purged = 0
+        while guest_keys := list(
+            carts.values_list('guest_key', flat=True)[:PURGE_BATCH_SIZE]
+        ):
+            purged += cls._purge_guests(carts, guest_keys)
+        return purged
+
+    @classmethod
+    def _purge_guests(cls, carts, guest_keys):
+        carts.filter(guest_key__in=guest_keys).delete()
+        return len(guest_keys)
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """
+    Корзина хранится в таблицах Cart и CartItem: каждое изменение сразу
+    записывается в базу.
+    """
+
+    def _cart(self):
+        cart, created = Cart.objects.get_or_create(**self.owner)
+        if not created:
+            self._touch()
+        return cart
+
+    def _touch(self):
+        """Продлевает жизнь гостевой корзины (см. purge_guest_carts)."""
+        if self.guest_key is not None:
+            Cart.objects.filter(guest_key=self.guest_key).update(
+                updated_at=timezone.now()
+            )
+
+    def _items(self):
+        return CartItem.objects.filter(
+            **{f'cart__{field}': value for field, value in self.owner.items()}
+        )
+
+    def get_cart(self, compact=False):
+        cart, _ = Cart.objects.with_totals().prefetch_related(
+            Prefetch('items', queryset=_cart_items(compact).order_by('id'))
+        ).get_or_create(**self.owner)
+        return cart
+
+    def add(self, quantities):
+        if quantities:
+            CartItem.objects.add_quantities(self._cart().pk, quantities)
+
+    def set(self, quantities):
+        if quantities:
+            CartItem.objects.set_quantities(self._cart().pk, quantities)
+
+    def update(self, product_id, quantity):
+        self._touch()
+        return bool(
+            self._items().filter(product_id=product_id).update(
+                quantity=quantity
+            )
+        )
+
+    def remove(self, product_ids):
+        if not product_ids:
+            return 0
+        self._touch()
+        return self._items().filter(product_id__in=product_ids).delete()[0]
+
+    def clear(self):
+        self._touch()
+        return self._items().delete()[0]
+
+    def quantities(self):
+        return dict(self._items().values_list('product_id', 'quantity'))
+
+    def discard(self):
+        Cart.objects.filter(**self.owner).delete()
+
+    def apply(self, adds, sets, removes):
+        with transaction.atomic():
+            super().apply(adds, sets, removes)
+
+    def merge(self, other):
+        with transaction.atomic():
+            super().merge(other)
+
+
+class CartLocked(APIException):
+    """Корзину не удалось заблокировать за LOCK_TIMEOUT секунд."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Корзина занята другим запросом, повторите позже.'
+    default_code = 'cart_locked'
+
+
+class CacheCartStorage(BaseCartStorage):
+    """
+    Корзина хранится в кэше (CART_CACHE_ALIAS) и сохраняется в базу
+    отложенно: командой manage.py flush_carts по расписанию или вызовом
+    flush(), например при оформлении заказа.
+
+    Изменения корзины выполняются под блокировкой на cache.add, поэтому с
+    общим кэшем (redis) параллельные запросы разных процессов не теряют
+    обновлений. Если блокировку не удалось получить за LOCK_TIMEOUT
+    секунд, запрос завершается ошибкой 503 (CartLocked).
+
+    Несохраненные изменения отмечаются ключом DIRTY_KEY владельца. Первое
+    изменение после сохранения дописывает владельца в журнал (счетчик
+    JOURNAL_SEQ_KEY и записи JOURNAL_KEY), по которому flush_all находит
+    измененные корзины. Поэтому запись корзины не берет общую блокировку
+    и не зависит от числа несохраненных корзин. Кэш для корзин не должен
+    вытеснять ключи (например, redis с maxmemory-policy noeviction), иначе
+    несохраненные изменения будут потеряны.
+    """
+    ITEMS_KEY = 'cart:items:{}'
+    CART_ID_KEY = 'cart:id:{}'
+    LOCK_KEY = 'cart:lock:{}'
+    DIRTY_KEY = 'cart:dirty:{}'
+    JOURNAL_KEY = 'cart:journal:{}'
+    JOURNAL_SEQ_KEY = 'cart:journal:seq'
+    JOURNAL_CURSOR_KEY = 'cart:journal:cursor'
+    LOCK_TIMEOUT = 5
+
+    def __init__(self, user=None, guest_key=None):
+        super().__init__(user, guest_key)
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self.owner_key = (
+            ('user', user.pk) if user is not None else ('guest', guest_key)
+        )
+        owner = ':'.join(str(part) for part in self.owner_key)
+        self.items_key = self.ITEMS_KEY.format(owner)
+        self.cart_id_key = self.CART_ID_KEY.format(owner)
+        self.lock_key = self.LOCK_KEY.format(owner)
+        self.dirty_key = self.DIRTY_KEY.format(owner)
+
+    @contextmanager
+    def _locked(self, key):
+        """
+        Блокирует ключ key. Значение блокировки — уникальный токен: ключ
+        удаляется, только если блокировка все еще принадлежит этому
+        запросу, а не перешла к другому после истечения LOCK_TIMEOUT.
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while not self.cache.add(key, token, timeout=self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise CartLocked
+            time.sleep(0.001)
+        try:
+            yield
+        finally:
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def _load(self):
+        items = self.cache.get(self.items_key)
+        if items is None:
+            items = DatabaseCartStorage(
+                self.user, self.guest_key
+            ).quantities()
+            self.cache.set(self.items_key, items, timeout=None)
+        return items
+
+    def _cart_id(self):
+        """
+        Возвращает id корзины в базе, как у DatabaseCartStorage: строка
+        Cart создается при первом чтении, а ее id хранится в кэше.
+        """
+        cart_id = self.cache.get(self.cart_id_key)
+        if cart_id is None:
+            cart_id = Cart.objects.get_or_create(**self.owner)[0].pk
+            self.cache.set(self.cart_id_key, cart_id, timeout=None)
+        return cart_id
+
+    @contextmanager
+    def _change(self):
+        with self._locked(self.lock_key):
+            items = self._load()
+            yield items
+            self.cache.set(self.items_key, items, timeout=None)
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        """Отмечает корзину измененной; вызывается под блокировкой."""
+        if self.cache.add(self.dirty_key, True, timeout=None):
+            self._append_journal()
+
+    def _append_journal(self):
+        self.cache.add(self.JOURNAL_SEQ_KEY, 0, timeout=None)
+        position = self.cache.incr(self.JOURNAL_SEQ_KEY)
+        self.cache.set(self.JOURNAL_KEY.format(position), self.owner_key,
+                       timeout=None)
+
+    @classmethod
+    def _purge_guests(cls, carts, guest_keys):
+        """
+        Удаляет корзины вместе с их ключами в кэше. Корзины с
+        несохраненными изменениями пропускаются: ими пользовались после
+        последнего сохранения.
+        """
+        storages = [cls(guest_key=guest_key) for guest_key in guest_keys]
+        cache = caches[settings.CART_CACHE_ALIAS]
+        dirty = cache.get_many([storage.dirty_key for storage in storages])
+        stale = [storage for storage in storages
+                 if storage.dirty_key not in dirty]
+        cache.delete_many(
+            [storage.items_key for storage in stale]
+            + [storage.cart_id_key for storage in stale]
+        )
+        carts.filter(
+            guest_key__in=[storage.guest_key for storage in stale]
+        ).delete()
+        if len(stale) < len(storages):
+            Cart.objects.filter(
+                guest_key__in=[storage.guest_key for storage in storages
+                               if storage.dirty_key in dirty]
+            ).update(updated_at=timezone.now())
+        return len(stale)
+
+    def get_cart(self, compact=False):
+        quantities = self._load()
+        queryset = (
+            Product.objects.only(
+                *(column.removeprefix('product__') for column in
+                  CompactCartItemSerializer.Meta.columns
+                  if column.startswith('product__'))
+            ) if compact
+            else Product.objects.select_related('category', 'subcategory')
+        )
+        products = queryset.in_bulk(quantities)
+        items = [
+            CartItem(product=products[product_id], quantity=quantity)
+            for product_id, quantity in quantities.items()
+            if product_id in products
+        ]
+        return CartSnapshot(self._cart_id(), self.user, items)
+
+    def quantities(self):
+        return dict(self._load())
+
+    def discard(self):
+        with self._locked(self.lock_key):
+            self.cache.delete_many([self.items_key, self.cart_id_key,
+                                    self.dirty_key])
+            DatabaseCartStorage(self.user, self.guest_key).discard()
+
+    def add(self, quantities):
+        if quantities:
+            with self._change() as items:
+                for product_id, quantity in quantities.items():
+                    items[product_id] = items.get(product_id, 0) + quantity
+
+    def set(self, quantities):
+        if quantities:
+            with self._change() as items:
+                items.update(quantities)
+
+    def update(self, product_id, quantity):
+        with self._change() as items:
+            found = product_id in items
+            if found:
+                items[product_id] = quantity
+        return found
+
+    def remove(self, product_ids):
+        with self._change() as items:
+            removed = [
+                items.pop(product_id) for product_id in product_ids
+                if product_id in items
+            ]
+        return len(removed)
+
+    def clear(self):
+        with self._change() as items:
+            removed = len(items)
+            items.clear()
+        return removed
+
+    def apply(self, adds, sets, removes):
+        with self._change() as items:
+            for product_id in removes:
+                items.pop(product_id, None)
+            items.update(sets)
+            for product_id, quantity in adds.items():
+                items[product_id] = items.get(product_id, 0) + quantity
+
+    def flush(self):
+        """
+        Записывает корзину из кэша в Cart/CartItem. Товары, удаленные из
+        каталога после добавления в корзину, отбрасываются.
+        """
+        with self._locked(self.lock_key):
+            items = self.cache.get(self.items_key)
+            if items is not None:
+                existing = set(
+                    Product.objects.filter(pk__in=items)
+                    .values_list('pk', flat=True)
+                )
+                if len(existing) < len(items):
+                    items = {
+                        product_id: quantity
+                        for product_id, quantity in items.items()
+                        if product_id in existing
+                    }
+                    self.cache.set(self.items_key, items, timeout=None)
+                with transaction.atomic():
+                    cart, created = Cart.objects.get_or_create(**self.owner)
+                    if not created:
+                        cart.save(update_fields=['updated_at'])
+                    cart.items.exclude(product_id__in=items).delete()
+                    CartItem.objects.set_quantities(cart.pk, items)
+                self.cache.set(self.cart_id_key, cart.pk, timeout=None)
+            self.cache.delete(self.dirty_key)
+
+    @classmethod
+    def _read_journal(cls, cache):
+        """
+        Возвращает владельцев из журнала, прежнюю позицию чтения и новое
+        состояние курсора. Отсутствующая запись (процесс увеличил
+        счетчик, но еще не сохранил ее) останавливает чтение; если ее нет
+        и при следующем вызове, она пропускается.
+        """
+        cursor = cache.get(cls.JOURNAL_CURSOR_KEY,
+                           {'position': 0, 'missing': None})
+        positions = range(cursor['position'] + 1,
+                          cache.get(cls.JOURNAL_SEQ_KEY, 0) + 1)
+        entries = cache.get_many([
+            cls.JOURNAL_KEY.format(position) for position in positions
+        ])
+        owners = []
+        position, missing = cursor['position'], None
+        for current in positions:
+            owner = entries.get(cls.JOURNAL_KEY.format(current))
+            if owner is None and current != cursor['missing']:
+                missing = current
+                break
+            position = current
+            if owner is not None:
+                owners.append(owner)
+        return owners, cursor['position'], {'position': position,
+                                            'missing': missing}
+
+    @classmethod
+    def flush_all(cls):
+        """
+        Сохраняет в базу все корзины с отложенными изменениями и
+        возвращает их число. Ошибка одной корзины записывается в лог и не
+        мешает остальным: такая корзина снова попадает в журнал и
+        сохраняется при следующем вызове.
+        """
+        cache = caches[settings.CART_CACHE_ALIAS]
+        owners, previous, cursor = cls._read_journal(cache)
+        owners = list(dict.fromkeys(owners))
+        users = get_user_model().objects.in_bulk(
+            [owner for kind, owner in owners if kind == 'user']
+        )
+        storages = [cls(user=user) for user in users.values()] + [
+            cls(guest_key=owner) for kind, owner in owners if kind == 'guest'
+        ]
+        flushed = 0
+        for storage in storages:
+            try:
+                storage.flush()
+            except (CartLocked, DatabaseError):
+                logger.exception('Cart %s flush failed', storage.owner_key)
+                storage._append_journal()
+            else:
+                flushed += 1
+        cache.delete_many([
+            cls.JOURNAL_KEY.format(position)
+            for position in range(previous + 1, cursor['position'] + 1)
+        ])
+        cache.set(cls.JOURNAL_CURSOR_KEY, cursor, timeout=None)
+        return flushed
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+from .cart_storage import CacheCartStorage, get_storage_class
+
+
+@register()
+def check_cart_cache(app_configs, **kwargs):
+    """
+    Запрещает хранить корзины CacheCartStorage в locmem: такой кэш у
+    каждого процесса свой и вытесняет ключи, поэтому корзины расходятся
+    между воркерами, а несохраненные изменения теряются.
+    """
+    if not issubclass(get_storage_class(), CacheCartStorage):
+        return []
+    if isinstance(caches[settings.CART_CACHE_ALIAS], LocMemCache):
+        return [Error(
+            f'Кэш {settings.CART_CACHE_ALIAS!r} (CART_CACHE_ALIAS) '
+            'использует locmem, непригодный для CacheCartStorage.',
+            hint='Задайте CART_CACHE_BACKEND=redis и CART_CACHE_LOCATION.',
+            id='api.E001',
+        )]
+    return []
@@ -0,0 +1,108 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .services import category_tree
+from products.search import search_products
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Фильтры списка продуктов:
+        - category, subcategory: слаг категории или подкатегории;
+        - min_price, max_price: границы цены включительно.
+
+    Слаги разрешаются в id по дереву категорий в памяти, поэтому запрос
+    к продуктам не присоединяет таблицы категорий и использует индексы
+    (category, price, id) и (subcategory, id).
+    """
+    price_params = {'min_price': 'price__gte', 'max_price': 'price__lte'}
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        lookups = {}
+        for param, field, get_object in (
+            ('category', 'category', category_tree.get_category_by_slug),
+            ('subcategory', 'subcategory',
+             category_tree.get_subcategory_by_slug),
+        ):
+            slug = params.get(param)
+            if slug:
+                found = get_object(slug, request)
+                if found is None:
+                    return queryset.none()
+                lookups[f'{field}_id'] = found.pk
+        for param, lookup in self.price_params.items():
+            value = params.get(param)
+            if value:
+                lookups[lookup] = self._parse_price(param, value)
+        return queryset.filter(**lookups)
+
+    @staticmethod
+    def _parse_price(param, value):
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            price = None
+        if price is None or not price.is_finite():
+            raise ValidationError({param: 'Укажите число.'})
+        return price
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': {'type': schema_type},
+            }
+            for name, schema_type, description in (
+                ('category', 'string', 'Слаг категории'),
+                ('subcategory', 'string', 'Слаг подкатегории'),
+                ('min_price', 'number', 'Минимальная цена'),
+                ('max_price', 'number', 'Максимальная цена'),
+            )
+        ]
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Поиск продуктов по словам названия (?search=...) по полнотекстовому
+    индексу (см. products.search).
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        return search_products(queryset, text) if text.strip() else queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Слова из названия продукта',
+            'schema': {'type': 'string'},
+        }]
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    Сортировка продуктов (?ordering=price, -price, name, -name, id).
+
+    К выбранной сортировке добавляется id в том же направлении: порядок
+    становится однозначным для пагинации и совпадает с составными
+    индексами (price, id) и (name, id).
+    """
+    ordering_fields = ('price', 'name', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        ordering = list(ordering)
+        if ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cart_storage import CacheCartStorage
+
+
+class Command(BaseCommand):
+    help = ('Сохраняет в базу корзины с отложенными изменениями из '
+            'CacheCartStorage.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять сохранение каждые N секунд (0 — один раз).'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = CacheCartStorage.flush_all()
+            self.stdout.write(f'Сохранено корзин: {flushed}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
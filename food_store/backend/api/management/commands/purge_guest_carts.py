@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.cart_storage import get_storage_class
+
+
+class Command(BaseCommand):
+    help = ('Удаляет гостевые корзины, которые не изменялись дольше срока '
+            'жизни сессии (ключ корзины хранится в сессии посетителя).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.SESSION_COOKIE_AGE,
+            help='Возраст корзины в секундах (по умолчанию — '
+                 'SESSION_COOKIE_AGE).'
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(seconds=options['max_age'])
+        purged = get_storage_class().purge_guest_carts(before)
+        self.stdout.write(f'Удалено гостевых корзин: {purged}')
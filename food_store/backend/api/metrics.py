@@ -0,0 +1,387 @@
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer
+
+PREFIX = 'food_store'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE',
+                     'OPTIONS'))
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RouteStats:
+    """Накопленные показатели одного маршрута и метода."""
+
+    __slots__ = ('statuses', 'latency', 'latency_sum', 'sizes', 'size_sum',
+                 'queries', 'sql_seconds', 'serialize_seconds', 'cache_hits',
+                 'cache_misses')
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.sizes = [0] * len(SIZE_BUCKETS)
+        self.size_sum = 0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def count(self):
+        return sum(self.statuses.values())
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def merge(self, data):
+        for status, count in list(data['statuses'].items()):
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        for name in ('latency', 'sizes'):
+            setattr(self, name, [
+                own + other for own, other in zip(getattr(self, name),
+                                                  data[name])
+            ])
+        for name in ('latency_sum', 'size_sum', 'queries', 'sql_seconds',
+                     'serialize_seconds', 'cache_hits', 'cache_misses'):
+            # Файлы процессов прежней версии не содержат новых полей.
+            setattr(self, name, getattr(self, name) + data.get(name, 0))
+
+
+def _observe(buckets, bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[index] += 1
+            return
+
+
+class MetricsRegistry:
+    """
+    Показатели запросов процесса.
+
+    Каждый поток пишет только в свой словарь, поэтому запись не требует
+    блокировок; блокировка берется один раз при первом запросе потока.
+    При чтении словари потоков суммируются. Словари завершившихся потоков
+    (например, при потоке на запрос в runserver) переносятся в общий
+    словарь, поэтому память и стоимость чтения не растут с числом
+    запросов. После fork() показатели родителя сбрасываются, чтобы
+    воркеры не учитывали их повторно.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._finished = {}
+        self.last_dump = 0.0
+
+    def _thread_stats(self):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = {}
+            with self._lock:
+                self._fold_finished()
+                self._threads.append((threading.current_thread(), stats))
+        return stats
+
+    def _fold_finished(self):
+        """Переносит показатели завершившихся потоков; под блокировкой."""
+        alive = []
+        for thread, stats in self._threads:
+            if thread.is_alive():
+                alive.append((thread, stats))
+                continue
+            for key, route_stats in stats.items():
+                self._finished.setdefault(key, RouteStats()).merge(
+                    route_stats.to_dict()
+                )
+        self._threads = alive
+
+    def record(self, route, method, status, latency, size, queries,
+               sql_seconds, serialize_seconds, cache_hits=0, cache_misses=0):
+        stats = self._thread_stats()
+        route_stats = stats.get((route, method))
+        if route_stats is None:
+            route_stats = stats[(route, method)] = RouteStats()
+        status = str(status)
+        route_stats.statuses[status] = route_stats.statuses.get(status, 0) + 1
+        _observe(route_stats.latency, LATENCY_BUCKETS, latency)
+        route_stats.latency_sum += latency
+        _observe(route_stats.sizes, SIZE_BUCKETS, size)
+        route_stats.size_sum += size
+        route_stats.queries += queries
+        route_stats.sql_seconds += sql_seconds
+        route_stats.serialize_seconds += serialize_seconds
+        route_stats.cache_hits += cache_hits
+        route_stats.cache_misses += cache_misses
+
+    def snapshot(self):
+        """Возвращает сумму показателей всех потоков процесса."""
+        with self._lock:
+            self._fold_finished()
+            sources = [self._finished] + [
+                stats for _, stats in self._threads
+            ]
+            total = {}
+            for stats in sources:
+                for key, route_stats in list(stats.items()):
+                    total.setdefault(key, RouteStats()).merge(
+                        route_stats.to_dict()
+                    )
+        return total
+
+    def dump(self, directory):
+        """Атомарно записывает показатели процесса в файл <pid>.json."""
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump([
+                [route, method, stats.to_dict()]
+                for (route, method), stats in self.snapshot().items()
+            ], file)
+        os.replace(temporary, path)
+        self.last_dump = time.monotonic()
+
+    def collect(self, directory=None):
+        """
+        Возвращает показатели процесса, а если задан каталог — сумму по
+        файлам всех процессов (для текущего берутся живые значения).
+        """
+        total = self.snapshot()
+        if not directory or not os.path.isdir(directory):
+            return total
+        own = f'{os.getpid()}.json'
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name == own:
+                continue
+            try:
+                with open(os.path.join(directory, name)) as file:
+                    entries = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for route, method, data in entries:
+                total.setdefault((route, method), RouteStats()).merge(data)
+        return total
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+class RequestMetrics:
+    """Показатели текущего запроса, которые собирают обертки."""
+
+    __slots__ = ('queries', 'sql_seconds', 'serialize_seconds',
+                 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """
+    Записывает для каждого запроса маршрут (имя URL), статус, время
+    ответа, размер ответа, число и время SQL-запросов, время рендеринга
+    ответа DRF и попадания и промахи кэша ответов каталога.
+
+    Должен стоять первым в MIDDLEWARE. Отключается настройкой
+    METRICS_ENABLED. При нескольких WSGI-процессах задайте
+    METRICS_MULTIPROC_DIR: каждый процесс не чаще раза в
+    METRICS_DUMP_INTERVAL секунд сохраняет туда свои показатели, а
+    /metrics суммирует их.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        latency = time.perf_counter() - started
+
+        match = request.resolver_match
+        registry.record(
+            match.view_name if match else 'unmatched',
+            request.method if request.method in METHODS else 'other',
+            response.status_code,
+            latency,
+            0 if response.streaming else len(response.content),
+            metrics.queries,
+            metrics.sql_seconds,
+            metrics.serialize_seconds,
+            metrics.cache_hits,
+            metrics.cache_misses
+        )
+        directory = settings.METRICS_MULTIPROC_DIR
+        if directory and (time.monotonic() - registry.last_dump
+                          >= settings.METRICS_DUMP_INTERVAL):
+            registry.dump(directory)
+        return response
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer, учитывающий время рендеринга в показателях запроса."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        finally:
+            metrics.serialize_seconds += time.perf_counter() - started
+
+
+def record_cache_outcome(outcome):
+    """Учитывает в показателях запроса попадание или промах кэша каталога."""
+    metrics = _current.get()
+    if metrics is None:
+        return
+    if outcome == 'hit':
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    )
+
+
+def _histogram(lines, name, labels, bounds, buckets, total, count):
+    cumulative = 0
+    for bound, bucket in zip(bounds, buckets):
+        cumulative += bucket
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {count}')
+
+
+def render_metrics(stats):
+    """Форматирует показатели в текстовом формате Prometheus."""
+    metrics = {
+        'http_requests_total': ('counter', 'Число запросов.'),
+        'http_request_duration_seconds': (
+            'histogram', 'Время ответа.'
+        ),
+        'http_response_size_bytes': ('histogram', 'Размер ответа.'),
+        'db_queries_total': ('counter', 'Число SQL-запросов.'),
+        'db_query_duration_seconds_total': (
+            'counter', 'Суммарное время SQL-запросов.'
+        ),
+        'serialization_duration_seconds_total': (
+            'counter', 'Суммарное время рендеринга ответов DRF.'
+        ),
+        'catalog_cache_requests_total': (
+            'counter', 'Обращения к кэшу ответов каталога.'
+        ),
+    }
+    lines = {name: [] for name in metrics}
+    for (route, method), route_stats in sorted(stats.items()):
+        labels = _labels(route=route, method=method)
+        count = route_stats.count
+        for status, status_count in sorted(route_stats.statuses.items()):
+            lines['http_requests_total'].append(
+                f'{PREFIX}_http_requests_total'
+                f'{{{labels},status="{status}"}} {status_count}'
+            )
+        _histogram(lines['http_request_duration_seconds'],
+                   f'{PREFIX}_http_request_duration_seconds', labels,
+                   LATENCY_BUCKETS, route_stats.latency,
+                   route_stats.latency_sum, count)
+        _histogram(lines['http_response_size_bytes'],
+                   f'{PREFIX}_http_response_size_bytes', labels,
+                   SIZE_BUCKETS, route_stats.sizes, route_stats.size_sum,
+                   count)
+        for name, value in (
+            ('db_queries_total', route_stats.queries),
+            ('db_query_duration_seconds_total', route_stats.sql_seconds),
+            ('serialization_duration_seconds_total',
+             route_stats.serialize_seconds),
+        ):
+            lines[name].append(f'{PREFIX}_{name}{{{labels}}} {value}')
+        if route_stats.cache_hits or route_stats.cache_misses:
+            for outcome, value in (('hit', route_stats.cache_hits),
+                                   ('miss', route_stats.cache_misses)):
+                lines['catalog_cache_requests_total'].append(
+                    f'{PREFIX}_catalog_cache_requests_total'
+                    f'{{{labels},outcome="{outcome}"}} {value}'
+                )
+
+    output = []
+    for name, (metric_type, description) in metrics.items():
+        output.append(f'# HELP {PREFIX}_{name} {description}')
+        output.append(f'# TYPE {PREFIX}_{name} {metric_type}')
+        output.extend(lines[name])
+    return '\n'.join(output) + '\n'
+
+
+def _metrics_allowed(request):
+    """
+    Разрешает /metrics адресам из METRICS_ALLOWED_IPS и запросам с
+    заголовком Authorization: Bearer <METRICS_TOKEN>.
+    """
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.META.get(
+        'HTTP_AUTHORIZATION', ''
+    ).partition(' ')
+    return bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' and (
+        constant_time_compare(token, settings.METRICS_TOKEN)
+    )
+
+
+def metrics_view(request):
+    """Отдает показатели всех процессов в формате Prometheus."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    stats = registry.collect(settings.METRICS_MULTIPROC_DIR)
+    return HttpResponse(render_metrics(stats), content_type=CONTENT_TYPE)
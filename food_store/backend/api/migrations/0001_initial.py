@@ -0,0 +1,26 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('label', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Модель')),
+                ('version', models.PositiveBigIntegerField(verbose_name='Версия')),
+                ('modified_at', models.DateTimeField(verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы каталога',
+                'verbose_name_plural': 'Версии таблиц каталога',
+            },
+        ),
+    ]
@@ -1,3 +1,25 @@
 from django.db import models
 
-# Create your models here.
+from backend.constants import MAX_MODEL_LABEL
+
+
+class CatalogVersion(models.Model):
+    """
+    Версия таблицы каталога для ключей кэша ответов и ETag, когда кэш не
+    общий для процессов (CATALOG_CACHE_SHARED=False).
+
+    Версия увеличивается теми же сигналами, что и версия в общем кэше,
+    поэтому изменение в одном воркере видно остальным, а чтение версий
+    всех таблиц ответа — один запрос по первичному ключу.
+    """
+    label = models.CharField(max_length=MAX_MODEL_LABEL, primary_key=True,
+                             verbose_name='Модель')
+    version = models.PositiveBigIntegerField(verbose_name='Версия')
+    modified_at = models.DateTimeField(verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Версия таблицы каталога'
+        verbose_name_plural = 'Версии таблиц каталога'
+
+    def __str__(self):
+        return f'{self.label}: {self.version}'
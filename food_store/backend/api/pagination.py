@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CatalogPageSizeMixin:
+    """
+    Позволяет клиенту выбрать размер страницы параметром page_size,
+    ограниченным настройкой CATALOG_MAX_PAGE_SIZE.
+    """
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.CATALOG_MAX_PAGE_SIZE
+
+
+class CatalogPageNumberPagination(CatalogPageSizeMixin, PageNumberPagination):
+    """Постраничная пагинация каталога по номеру страницы."""
+
+
+class ProductCursorPagination(CatalogPageSizeMixin, CursorPagination):
+    """
+    Keyset-пагинация продуктов по первичному ключу.
+
+    Страница выбирается условием id > курсор по индексу, без COUNT(*) и
+    OFFSET, поэтому обход всего каталога линеен по числу продуктов.
+    """
+    ordering = ('id',)
@@ -0,0 +1,266 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+FORMATS = ('pstats', 'speedscope')
+SQL_STACK_DEPTH = 8
+PROFILE_NAME = re.compile(r'[\w-]+\.(prof|speedscope\.json|sql\.json)')
+
+# Профилируется один запрос за раз: так cProfile и выборка стека не
+# мешают друг другу, а нагрузка от профилирования ограничена.
+_lock = threading.Lock()
+
+
+def _requested_format(request):
+    """
+    Возвращает формат профиля, запрошенный заголовком X-Profile или
+    параметром _profile, или None. Значение 1 означает pstats.
+    """
+    value = request.META.get(HEADER)
+    if value is None:
+        value = request.GET.get(QUERY_PARAM)
+    if value is None:
+        return None
+    value = value.strip().lower()
+    return FORMATS[0] if value in ('', '1', 'true') else value
+
+
+def _is_staff(request):
+    """
+    Проверяет, что запрос от сотрудника. Кроме сессии учитывается токен:
+    DRF проверяет его только во view, а профилирование начинается раньше.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_active and user.is_staff)
+
+
+class SQLLog:
+    """
+    Обертка execute_wrapper, записывающая SQL-запросы со временем
+    выполнения и местом в коде проекта, откуда они были вызваны.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.root = str(settings.BASE_DIR)
+
+    def origin(self):
+        return [
+            f'{os.path.relpath(frame.filename, self.root)}:{frame.lineno} '
+            f'in {frame.name}'
+            for frame in traceback.extract_stack()[:-2]
+            if frame.filename.startswith(self.root)
+            and 'site-packages' not in frame.filename
+            and frame.filename != __file__
+        ][-SQL_STACK_DEPTH:]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': None if many else repr(params),
+                'many': many,
+                'duration_ms': round(
+                    (time.perf_counter() - started) * 1000, 3
+                ),
+                'stack': self.origin(),
+            })
+
+
+class StackSampler:
+    """
+    Профилировщик выборкой: отдельный поток каждые interval секунд
+    снимает стек профилируемого потока. Результат сохраняется в формате
+    speedscope (https://www.speedscope.app) с весом выборки, равным
+    времени с предыдущей выборки.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.finished = time.perf_counter()
+
+    def _run(self):
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                stack.append(self.frames.setdefault(key, len(self.frames)))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - previous)
+            previous = now
+
+    def speedscope(self, name):
+        frames = sorted(self.frames, key=self.frames.get)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'exporter': 'food_store',
+            'name': name,
+            'shared': {'frames': [
+                {'name': function, 'file': path, 'line': line}
+                for function, path, line in frames
+            ]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.finished - self.started,
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+        }
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос сотрудника, если он передал заголовок
+    X-Profile или параметр _profile со значением pstats (cProfile) или
+    speedscope (выборка стека раз в PROFILE_SAMPLE_INTERVAL секунд).
+
+    Профиль и журнал SQL-запросов (время, параметры, место вызова в коде
+    проекта) сохраняются в PROFILE_DIR, а ссылки на них возвращаются в
+    заголовках X-Profile-Download и X-Profile-SQL. Скачать их может
+    только сотрудник. Запросы без флага проходят без дополнительной
+    работы, кроме проверки заголовка и строки запроса. Отключается
+    настройкой PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (HEADER not in request.META
+                and QUERY_PARAM not in request.META.get('QUERY_STRING', '')):
+            return self.get_response(request)
+        profile_format = _requested_format(request)
+        if profile_format is None or not _is_staff(request):
+            return self.get_response(request)
+        if profile_format not in FORMATS:
+            response = self.get_response(request)
+            response['X-Profile-Error'] = (
+                f'Неизвестный формат профиля, допустимы: {", ".join(FORMATS)}.'
+            )
+            return response
+        if not _lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Error'] = 'Уже профилируется другой запрос.'
+            return response
+        try:
+            return self.profile(request, profile_format)
+        finally:
+            _lock.release()
+
+    def profile(self, request, profile_format):
+        profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        sql_log = SQLLog()
+        # Декораторы кэша каталога пропускают такой запрос, чтобы профиль
+        # показывал построение ответа, а не чтение из кэша.
+        request.is_profiled = True
+        if profile_format == 'pstats':
+            profiler = cProfile.Profile()
+        else:
+            profiler = StackSampler(settings.PROFILE_SAMPLE_INTERVAL)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql_log))
+            stack.enter_context(profiler)
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        title = f'{request.method} {request.get_full_path()}'
+        if profile_format == 'pstats':
+            profile_name = f'{profile_id}.prof'
+            profiler.dump_stats(directory / profile_name)
+        else:
+            profile_name = f'{profile_id}.speedscope.json'
+            (directory / profile_name).write_text(
+                json.dumps(profiler.speedscope(title))
+            )
+        sql_name = f'{profile_id}.sql.json'
+        (directory / sql_name).write_text(json.dumps({
+            'request': title,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'sql_duration_ms': round(
+                sum(query['duration_ms'] for query in sql_log.queries), 3
+            ),
+            'queries': sql_log.queries,
+        }, ensure_ascii=False, indent=2))
+
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Download'] = reverse(
+            'profile-download', kwargs={'name': profile_name}
+        )
+        response['X-Profile-SQL'] = reverse(
+            'profile-download', kwargs={'name': sql_name}
+        )
+        return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download_view(request, name):
+    """Отдает сотруднику сохраненный профиль или журнал SQL-запросов."""
+    path = Path(settings.PROFILE_DIR) / name
+    if not PROFILE_NAME.fullmatch(name) or not path.is_file():
+        raise Http404
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name)
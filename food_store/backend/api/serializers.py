@@ -1,8 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.validators import MaxValueValidator, MinValueValidator
 from rest_framework import serializers
 
-from backend.constants import MIN_QUANTITY
+from backend.constants import (
+    MAX_BATCH_OPERATIONS,
+    MAX_QUANTITY,
+    MIN_QUANTITY,
+    PRICE_DECIMAL,
+    PRICE_MAX,
+)
 from products.models import Cart, CartItem, Category, Product, Subcategory
 
 
@@ -63,6 +70,35 @@ class CategoryProductSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'slug', 'image')
 
 
+class ImageVariantsField(serializers.Field):
+    """
+    Поле для вывода вариантов изображения продукта в виде srcset по
+    форматам, например {'webp': '<url> 150w, <url> 300w', 'jpeg': ...}.
+    Клиент выбирает первый поддерживаемый формат и подходящую ширину.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        srcset = {}
+        for variant in sorted(variants.values(),
+                              key=lambda variant: variant['width']):
+            for image_format, path in variant['formats'].items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                srcset.setdefault(image_format, []).append(
+                    f'{url} {variant["width"]}w'
+                )
+        return {
+            image_format: ', '.join(candidates)
+            for image_format, candidates in srcset.items()
+        }
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """
     Сериализатор для работы с продуктами.
@@ -74,6 +110,7 @@ class ProductSerializer(serializers.ModelSerializer):
         - image_small: Маленькое изображение продукта.
         - image_medium: Среднее изображение продукта.
         - image_large: Большое изображение продукта.
+        - srcset: Варианты изображения по форматам в формате srcset.
         - category: Информация о категории продукта.
         - subcategory: Информация о подкатегории продукта.
         - price: Цена продукта.
@@ -81,13 +118,34 @@ class ProductSerializer(serializers.ModelSerializer):
     image_small = serializers.ImageField(read_only=True)
     image_medium = serializers.ImageField(read_only=True)
     image_large = serializers.ImageField(read_only=True)
+    srcset = ImageVariantsField(source='image_variants')
     category = CategoryProductSerializer(read_only=True)
     subcategory = SubcategorySerializer(read_only=True)
 
     class Meta:
         model = Product
         fields = ('id', 'name', 'slug', 'image_small', 'image_medium',
-                  'image_large', 'category', 'subcategory', 'price')
+                  'image_large', 'srcset', 'category', 'subcategory',
+                  'price')
+        related_fields = ('category', 'subcategory')
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Подготавливает queryset под поля, которые выводит сериализатор:
+        категория и подкатегория подтягиваются одним JOIN, а из базы
+        выбираются только отображаемые колонки.
+        """
+        related_fields = cls.Meta.related_fields
+        fields = cls().fields
+        columns = [
+            fields[name].source
+            for name in cls.Meta.fields if name not in related_fields
+        ]
+        for name in related_fields:
+            nested = cls._declared_fields[name]
+            columns += [f'{name}__{field}' for field in nested.Meta.fields]
+        return queryset.select_related(*related_fields).only(*columns)
 
 
 class CartItemWithDetailsSerializer(serializers.ModelSerializer):
@@ -107,6 +165,27 @@ class CartItemWithDetailsSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_id', 'quantity']
 
 
+class CompactCartItemSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор для компактного отображения товара в корзине: только
+    идентификатор, название, цена и маленькое изображение продукта.
+    """
+    product_id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(source='product.name', read_only=True)
+    price = serializers.DecimalField(
+        source='product.price', read_only=True,
+        max_digits=PRICE_MAX, decimal_places=PRICE_DECIMAL
+    )
+    image_small = serializers.ImageField(source='product.image_small',
+                                         read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['product_id', 'name', 'price', 'image_small', 'quantity']
+        columns = ('id', 'cart', 'quantity', 'product__name',
+                   'product__price', 'product__image_small')
+
+
 class CartItemAddSerializer(serializers.ModelSerializer):
     """
     Сериализатор для добавления или обновления товара в корзине без вложенной
@@ -118,7 +197,7 @@ class CartItemAddSerializer(serializers.ModelSerializer):
         required=True
     )
     quantity = serializers.IntegerField(
-        validators=[MinValueValidator(1), MaxValueValidator(10_000_000)],
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_QUANTITY)],
         required=True
     )
 
@@ -135,6 +214,94 @@ class CartItemAddSerializer(serializers.ModelSerializer):
         return data
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """
+    Сериализатор одной операции пакетного изменения корзины.
+
+    Поля:
+        - op: Операция: add (добавить), set (установить количество)
+        или remove (удалить товар).
+        - product_id: Идентификатор продукта.
+        - quantity: Количество, обязательно для add и set.
+    """
+    ADD = 'add'
+    SET = 'set'
+    REMOVE = 'remove'
+
+    op = serializers.ChoiceField(choices=(ADD, SET, REMOVE))
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(
+        validators=[MinValueValidator(MIN_QUANTITY),
+                    MaxValueValidator(MAX_QUANTITY)],
+        required=False
+    )
+
+    def validate(self, data):
+        if data['op'] != self.REMOVE and 'quantity' not in data:
+            raise serializers.ValidationError(
+                {'quantity': 'Quantity is required for add and set.'}
+            )
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """
+    Сериализатор пакета операций с корзиной.
+
+    Существование всех продуктов пакета проверяется одним запросом
+    Product IN (...), а не отдельным запросом на каждую операцию.
+    """
+    operations = CartOperationSerializer(
+        many=True, allow_empty=False, max_length=MAX_BATCH_OPERATIONS
+    )
+
+    def validate_operations(self, operations):
+        product_ids = {operation['product_id'] for operation in operations}
+        missing = product_ids - set(
+            Product.objects.filter(pk__in=product_ids).values_list(
+                'pk', flat=True
+            )
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f'Products not found: {sorted(missing)}.'
+            )
+        return operations
+
+    def get_changes(self):
+        """
+        Сводит операции пакета к итоговым изменениям по каждому продукту
+        с учетом их порядка.
+
+        Возвращает (добавления, установки, удаления): словари
+        {id продукта: количество} и множество id продуктов.
+        """
+        changes = {}
+        for operation in self.validated_data['operations']:
+            product_id = operation['product_id']
+            op = operation['op']
+            if op == CartOperationSerializer.ADD:
+                previous_op, quantity = changes.get(product_id, (None, 0))
+                if previous_op == CartOperationSerializer.REMOVE:
+                    previous_op = CartOperationSerializer.SET
+                changes[product_id] = (
+                    previous_op or CartOperationSerializer.ADD,
+                    quantity + operation['quantity']
+                )
+            else:
+                changes[product_id] = (op, operation.get('quantity', 0))
+
+        adds, sets, removes = {}, {}, set()
+        for product_id, (op, quantity) in changes.items():
+            if op == CartOperationSerializer.ADD:
+                adds[product_id] = quantity
+            elif op == CartOperationSerializer.SET:
+                sets[product_id] = quantity
+            else:
+                removes.add(product_id)
+        return adds, sets, removes
+
+
 class CartSerializer(serializers.ModelSerializer):
     """
     Сериализатор для отображения корзины пользователя.
@@ -145,6 +312,9 @@ class CartSerializer(serializers.ModelSerializer):
         - items: Список товаров в корзине.
         - total_quantity: Общее количество товаров в корзине.
         - total_price: Общая стоимость товаров в корзине.
+
+    Итоги берутся из аннотаций Cart.objects.with_totals(), если они есть,
+    иначе вычисляются по товарам корзины.
     """
     items = CartItemWithDetailsSerializer(many=True, read_only=True)
     total_quantity = serializers.SerializerMethodField()
@@ -155,9 +325,24 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'items', 'total_quantity', 'total_price']
 
     def get_total_quantity(self, obj):
+        total_quantity = getattr(obj, 'total_quantity', None)
+        if total_quantity is not None:
+            return total_quantity
         return sum(item.quantity for item in obj.items.all())
 
     def get_total_price(self, obj):
+        total_price = getattr(obj, 'total_price', None)
+        if total_price is not None:
+            return total_price
         return sum(
             item.quantity * item.product.price for item in obj.items.all()
         )
+
+
+class CompactCartSerializer(CartSerializer):
+    """
+    Сериализатор для компактного отображения корзины (?view=compact):
+    товары выводятся через CompactCartItemSerializer без вложенных
+    категорий, подкатегорий и полного набора изображений.
+    """
+    items = CompactCartItemSerializer(many=True, read_only=True)
@@ -0,0 +1,103 @@
+import threading
+
+from django.db.models import Prefetch
+
+from .cache import request_versions
+from products.models import Category, Subcategory
+
+TREE_MODELS = (Category, Subcategory)
+
+
+class CategoryTree:
+    """
+    Дерево категорий с подкатегориями, закэшированное в памяти процесса.
+
+    Дерево строится двумя запросами (категории и все их подкатегории) при
+    первом обращении и хранится до вызова invalidate(), который вызывается
+    после коммита изменений моделей Category и Subcategory в этом
+    процессе. Изменения в других процессах обнаруживаются по версиям
+    таблиц (см. api.cache): дерево, построенное при другой версии,
+    строится заново. Версии читаются один раз за запрос, если передан
+    request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._categories = None
+        self._indexes = None
+        self._version = None
+
+    def _build(self):
+        return list(
+            Category.objects.order_by('id').prefetch_related(
+                Prefetch(
+                    'subcategories',
+                    queryset=Subcategory.objects.order_by('id')
+                )
+            )
+        )
+
+    def _load(self, request=None):
+        version = request_versions(request, TREE_MODELS)
+        categories = self._categories
+        if categories is not None and self._version == version:
+            return categories
+        with self._lock:
+            if self._categories is None or self._version != version:
+                generation = self._generation
+                categories = self._build()
+                if generation == self._generation:
+                    self._indexes = self._index(categories)
+                    self._categories = categories
+                    self._version = version
+                return categories
+            return self._categories
+
+    def get_categories(self, request=None):
+        """Возвращает список категорий с предзагруженными подкатегориями."""
+        return self._load(request)
+
+    @staticmethod
+    def _index(categories):
+        return {
+            'category_pk': {category.pk: category for category in categories},
+            'category_slug': {
+                category.slug: category for category in categories
+            },
+            'subcategory_slug': {
+                subcategory.slug: subcategory
+                for category in categories
+                for subcategory in category.subcategories.all()
+            },
+        }
+
+    def _get_index(self, name, request):
+        categories = self._load(request)
+        indexes = self._indexes
+        if indexes is None or self._categories is not categories:
+            indexes = self._index(categories)
+        return indexes[name]
+
+    def get_category(self, pk, request=None):
+        """Возвращает категорию по идентификатору или None."""
+        return self._get_index('category_pk', request).get(pk)
+
+    def get_category_by_slug(self, slug, request=None):
+        """Возвращает категорию по слагу или None."""
+        return self._get_index('category_slug', request).get(slug)
+
+    def get_subcategory_by_slug(self, slug, request=None):
+        """Возвращает подкатегорию по слагу или None."""
+        return self._get_index('subcategory_slug', request).get(slug)
+
+    def invalidate(self):
+        """Сбрасывает дерево, следующее обращение построит его заново."""
+        with self._lock:
+            self._generation += 1
+            self._categories = None
+            self._indexes = None
+            self._version = None
+
+
+category_tree = CategoryTree()
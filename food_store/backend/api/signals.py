@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .cart_storage import merge_guest_cart
+from .services import category_tree
+from products.models import Category, Product, Subcategory
+from products.signals import catalog_changed
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_delete, sender=Subcategory)
+def invalidate_category_tree(sender, **kwargs):
+    """
+    Сбрасывает кэш дерева категорий после коммита изменения: если
+    сбросить его раньше, параллельный запрос успеет построить дерево из
+    старых данных, и оно останется в кэше до следующего изменения.
+    """
+    transaction.on_commit(category_tree.invalidate)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Subcategory)
+@receiver(post_delete, sender=Subcategory)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Увеличивает версию таблицы после коммита, сбрасывая зависящие от нее
+    ответы. При увеличении до коммита параллельный промах успел бы
+    сохранить старые данные под новой версией.
+    """
+    transaction.on_commit(partial(bump_version, sender))
+
+
+@receiver(catalog_changed)
+def invalidate_after_bulk_change(sender, **kwargs):
+    """Сбрасывает кэши каталога после массовых изменений модели."""
+    if sender in (Category, Subcategory):
+        transaction.on_commit(category_tree.invalidate)
+    transaction.on_commit(partial(bump_version, sender))
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Переносит гостевую корзину посетителя в корзину пользователя."""
+    if request is not None and hasattr(request, 'session'):
+        merge_guest_cart(request, user)
@@ -1,24 +1,46 @@
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet, ViewSet
 
+from .cache import cache_response, conditional_response
+from .cart_storage import CartSnapshot, get_cart_storage
+from .filters import (
+    ProductFilterBackend,
+    ProductOrderingFilter,
+    ProductSearchFilter,
+)
+from .pagination import CatalogPageNumberPagination, ProductCursorPagination
 from .serializers import (
+    CartBatchSerializer,
     CartItemAddSerializer,
     CartSerializer,
     CategorySerializer,
+    CompactCartSerializer,
     ProductSerializer,
 )
-from products.models import Cart, CartItem, Category, Product
+from .services import category_tree
+from products.models import Category, Product, Subcategory
 
 User = get_user_model()
 
 
+def parse_pk(value):
+    """
+    Возвращает id из значения поиска, если это десятичное число ASCII в
+    пределах BigAutoField, иначе None (значение считается слагом).
+    """
+    if value.isascii() and value.isdigit() and int(value).bit_length() < 64:
+        return int(value)
+    return None
+
+
 class CategoryViewSet(ReadOnlyModelViewSet):
     """
     ViewSet для работы с категориями продуктов.
@@ -26,19 +48,69 @@ class CategoryViewSet(ReadOnlyModelViewSet):
     Доступ:
         - GET: Получение списка категорий или детализированной информации
         по категории.
+
+    Категории с подкатегориями отдаются из дерева, закэшированного в памяти
+    процесса (см. api.services.CategoryTree), без обращений к базе.
+    Категория адресуется по id или по слагу; /category/<слаг>/products/
+    возвращает продукты категории с фильтрами и пагинацией списка
+    продуктов.
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    lookup_value_regex = r'[-\w]+'
+
+    def get_object(self):
+        value = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        pk = parse_pk(value)
+        category = (
+            category_tree.get_category(pk, self.request) if pk is not None
+            else category_tree.get_category_by_slug(value, self.request)
+        )
+        if category is None:
+            raise Http404
+        self.check_object_permissions(self.request, category)
+        return category
 
     @swagger_auto_schema(security=[])
+    @conditional_response(Category, Subcategory)
+    @cache_response(Category, Subcategory)
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        categories = category_tree.get_categories(request)
+        page = self.paginate_queryset(categories)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(categories, many=True)
+        return Response(serializer.data)
 
     @swagger_auto_schema(security=[])
+    @conditional_response(Category, Subcategory)
+    @cache_response(Category, Subcategory)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        security=[],
+        responses={200: ProductSerializer(many=True)},
+        operation_description='Продукты категории'
+    )
+    @action(detail=True, methods=['get'])
+    @conditional_response(Product, Category, Subcategory)
+    @cache_response(Product, Category, Subcategory)
+    def products(self, request, *args, **kwargs):
+        category = self.get_object()
+        view = ProductViewSet(request=request, args=args, kwargs={},
+                              format_kwarg=self.format_kwarg, action='list')
+        queryset = view.filter_queryset(
+            view.get_queryset().filter(category_id=category.pk)
+        )
+        page = view.paginate_queryset(queryset)
+        if page is not None:
+            serializer = view.get_serializer(page, many=True)
+            return view.get_paginated_response(serializer.data)
+        return Response(view.get_serializer(queryset, many=True).data)
+
 
 class ProductViewSet(ReadOnlyModelViewSet):
     """
@@ -47,16 +119,63 @@ class ProductViewSet(ReadOnlyModelViewSet):
     Доступ:
         - GET: Получение списка продуктов или детализированной информации
         по продукту.
+
+    Фильтры (см. api.filters):
+        - ?category=, ?subcategory= — слаги категории и подкатегории;
+        - ?min_price=, ?max_price= — диапазон цены;
+        - ?search= — поиск по словам названия;
+        - ?ordering= — price, name или id, с минусом — по убыванию.
+
+    Пагинация:
+        - по умолчанию постраничная (?page=N);
+        - ?pagination=cursor включает keyset-пагинацию без COUNT(*).
+        Размер страницы задается параметром page_size.
+
+    Продукт адресуется по id (число) или по слагу и загружается одним
+    запросом вместе с категорией и подкатегорией.
     """
-    queryset = Product.objects.all()
+    queryset = Product.objects.order_by('id')
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    filter_backends = [ProductFilterBackend, ProductSearchFilter,
+                       ProductOrderingFilter]
+    ordering = ('id',)
+    lookup_value_regex = r'[-\w]+'
+    pagination_class = CatalogPageNumberPagination
+    cursor_pagination_class = ProductCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            query_params = getattr(self.request, 'query_params', {})
+            if query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        return self.get_serializer_class().setup_eager_loading(
+            super().get_queryset()
+        )
+
+    def get_object(self):
+        value = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        pk = parse_pk(value)
+        lookup = {'pk': pk} if pk is not None else {'slug': value}
+        product = get_object_or_404(self.get_queryset(), **lookup)
+        self.check_object_permissions(self.request, product)
+        return product
 
     @swagger_auto_schema(security=[])
+    @conditional_response(Product, Category, Subcategory)
+    @cache_response(Product, Category, Subcategory)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
     @swagger_auto_schema(security=[])
+    @conditional_response(Product, Category, Subcategory)
+    @cache_response(Product, Category, Subcategory)
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
@@ -66,18 +185,38 @@ class CartViewSet(ViewSet):
     ViewSet для управления корзиной пользователя.
 
     Доступ:
-        - GET: Получение информации о корзине пользователя.
+        - GET: Получение информации о корзине пользователя
+        (?view=compact — облегченное представление товаров).
         - POST: Добавление продукта в корзину.
         - PUT: Обновление количества товара в корзине.
+        - POST batch: Пакетное изменение корзины.
         - DELETE: Удаление товара из корзины или очистка корзины.
+
+    Корзина читается и изменяется через хранилище, выбранное настройкой
+    CART_STORAGE (см. api.cart_storage). Анонимному посетителю доступна
+    гостевая корзина, привязанная к его сессии; при входе она переносится
+    в корзину пользователя.
     """
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter(
+            'view', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+            enum=['full', 'compact'],
+            description='compact — только id, название, цена, маленькое '
+                        'изображение продукта и количество'
+        )
+    ])
     def list(self, request):
-        cart, _ = Cart.objects.prefetch_related(
-            'items__product').get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        storage = get_cart_storage(request, create=False)
+        compact = request.query_params.get('view') == 'compact'
+        cart = (
+            storage.get_cart(compact=compact) if storage is not None
+            else CartSnapshot(None, None, [])
+        )
+        if compact:
+            return Response(CompactCartSerializer(cart).data)
+        return Response(CartSerializer(cart).data)
 
     @swagger_auto_schema(
         responses={201: openapi.Response('Product added to cart')},
@@ -101,16 +240,7 @@ class CartViewSet(ViewSet):
         product = serializer.validated_data['product_id']
         quantity = serializer.validated_data['quantity']
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        get_cart_storage(request).add({product.pk: quantity})
 
         return Response(
             {'success': 'Product added to cart.'},
@@ -139,12 +269,9 @@ class CartViewSet(ViewSet):
 
         product = serializer.validated_data['product_id']
         quantity = serializer.validated_data['quantity']
-        cart_item = get_object_or_404(
-            CartItem, cart=request.user.shopping_cart, product=product
-        )
-
-        cart_item.quantity = quantity
-        cart_item.save()
+        storage = get_cart_storage(request, create=False)
+        if storage is None or not storage.update(product.pk, quantity):
+            raise Http404('No CartItem matches the given query.')
 
         return Response(
             {'success': 'Product quantity updated.'},
@@ -165,36 +292,47 @@ class CartViewSet(ViewSet):
     )
     @action(detail=False, methods=['delete'])
     def remove(self, request):
-        product_id = request.data.get('product_id')
-
-        if not product_id:
+        try:
+            product_id = int(request.data.get('product_id'))
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'Product ID is required.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        cart_item = get_object_or_404(
-            CartItem, cart=request.user.shopping_cart, product_id=product_id
-        )
-
-        cart_item.delete()
+        storage = get_cart_storage(request, create=False)
+        if storage is None or not storage.remove([product_id]):
+            raise Http404('No CartItem matches the given query.')
 
         return Response(
             {'success': 'Product removed from cart.'},
             status=status.HTTP_204_NO_CONTENT
         )
 
+    @swagger_auto_schema(
+        responses={200: CartSerializer},
+        operation_description=(
+            "Пакетно изменить корзину: операции add, set и remove "
+            "применяются по порядку в одной транзакции"
+        ),
+        request_body=CartBatchSerializer
+    )
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        get_cart_storage(request).apply(*serializer.get_changes())
+        return self.list(request)
+
     @action(detail=False, methods=['delete'])
     def clear(self, request):
-        cart = request.user.shopping_cart
-        if not cart.items.exists():
+        storage = get_cart_storage(request, create=False)
+        if storage is None or not storage.clear():
             return Response(
                 {'error': 'Cart is already empty.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        cart.items.all().delete()
-
         return Response(
             {'success': 'Cart cleared.'},
             status=status.HTTP_204_NO_CONTENT
@@ -2,5 +2,16 @@ MAX_SLUG = 100
 MAX_NAME = 150
 PRICE_MAX = 10
 PRICE_DECIMAL = 2
+PRICE_TOTAL_EXTRA_DIGITS = 8
 MIN_QUANTITY = 1
 ZERO = 0
+MAX_STATUS = 10
+MAX_HASH = 64
+MAX_GUEST_KEY = 32
+DEFAULT_PRODUCT_IMAGES = (
+    'products/default.jpg',
+    'products/original/default.jpg',
+)
+MAX_QUANTITY = 10_000_000
+MAX_BATCH_OPERATIONS = 500
+MAX_MODEL_LABEL = 100
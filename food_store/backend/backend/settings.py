@@ -1,5 +1,6 @@
 # flake8: noqa
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -9,7 +10,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'default-test-secret-key')
 
-DEBUG = os.environ.get('MODE_DEBUG', 'false').lower() in {'true', '1', 'yes', 'on'}
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in {'true', '1', 'yes', 'on'}
+
+
+DEBUG = env_flag('MODE_DEBUG', 'false')
 
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost').split(',')
 
@@ -30,11 +36,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -60,14 +68,103 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Профиль базы данных: DB_ENGINE=postgresql для продакшена или sqlite
+# (по умолчанию) для разработки и небольших установок.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # Пул соединений Django 5.1 (нужен пакет psycopg[pool]) несовместим с
+    # постоянными соединениями: при DB_POOL=true CONN_MAX_AGE равен 0, а
+    # соединения переиспользуются пулом. При DB_POOL=false каждый поток
+    # держит соединение DB_CONN_MAX_AGE секунд.
+    DB_POOL = env_flag('DB_POOL', 'true')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'food_store'),
+            'USER': os.environ.get('POSTGRES_USER', 'food_store'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': (
+                0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60))
+            ),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                },
+            } if DB_POOL else {},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {},
+        }
+    }
+    if env_flag('SQLITE_TUNED', 'true'):
+        # WAL позволяет читать во время записи, synchronous=NORMAL в режиме
+        # WAL безопасен и не делает fsync на каждую транзакцию. Транзакции
+        # начинаются с BEGIN IMMEDIATE, чтобы ожидание блокировки записи
+        # (timeout, секунды) происходило в начале транзакции, а не
+        # завершалось ошибкой database is locked посреди нее.
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={int(os.environ.get("SQLITE_MMAP_SIZE", 268435456))};'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+        }
+
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    # Отдельный кэш для CacheCartStorage: корзины не должны вытесняться
+    # ответами каталога и должны быть общими для всех процессов, поэтому
+    # locmem для него допустим только в тестах (см. api.checks).
+    'carts': {
+        'BACKEND': CACHE_BACKENDS[
+            os.environ.get('CART_CACHE_BACKEND', 'locmem')
+        ],
+        'LOCATION': os.environ.get('CART_CACHE_LOCATION', 'carts'),
+    },
 }
 
+# Хранилище корзин: api.cart_storage.DatabaseCartStorage (каждое изменение
+# пишется в базу) или api.cart_storage.CacheCartStorage (корзины в кэше,
+# в базу — командой manage.py flush_carts).
+CART_STORAGE = os.environ.get(
+    'CART_STORAGE', 'api.cart_storage.DatabaseCartStorage'
+)
+CART_CACHE_ALIAS = os.environ.get('CART_CACHE_ALIAS', 'carts')
 
+# Время жизни закэшированных ответов каталога (секунды).
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+# Общий ли кэш для всех процессов. Если нет (locmem), версии таблиц для
+# ключей кэша ответов и ETag хранятся в базе (api.CatalogVersion), иначе
+# воркер, не обработавший изменение, отдавал бы устаревшие данные.
+CATALOG_CACHE_SHARED = env_flag(
+    'CATALOG_CACHE_SHARED',
+    'false' if CACHES['default']['BACKEND'].endswith('LocMemCache')
+    else 'true'
+)
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -91,10 +188,41 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
 }
 
+# Показатели запросов для Prometheus (/metrics, см. api.metrics). При
+# нескольких WSGI-процессах METRICS_MULTIPROC_DIR — общий каталог, куда
+# процессы сохраняют показатели не чаще раза в METRICS_DUMP_INTERVAL секунд.
+METRICS_ENABLED = env_flag('METRICS_ENABLED', 'true')
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+METRICS_DUMP_INTERVAL = float(os.environ.get('METRICS_DUMP_INTERVAL', 1))
+# Доступ к /metrics: адреса (REMOTE_ADDR; за прокси — адрес прокси) и
+# токен для заголовка Authorization: Bearer <токен>.
+METRICS_ALLOWED_IPS = os.environ.get(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1'
+).split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Профилирование запросов сотрудников по заголовку X-Profile или параметру
+# _profile (см. api.profiling). Профили и журналы SQL сохраняются в
+# PROFILE_DIR; PROFILE_SAMPLE_INTERVAL — период выборки стека в секундах.
+PROFILING_ENABLED = env_flag('PROFILING_ENABLED', 'true')
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'food_store_profiles')
+)
+PROFILE_SAMPLE_INTERVAL = float(
+    os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.001)
+)
+
+# Максимальный размер страницы, который клиент может запросить page_size.
+CATALOG_MAX_PAGE_SIZE = int(os.environ.get('CATALOG_MAX_PAGE_SIZE', 100))
+
 LANGUAGE_CODE = 'ru-RU'
 
 TIME_ZONE = 'UTC'
@@ -110,6 +238,31 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Генерация уменьшенных изображений продуктов: 'thread' — пул потоков
+# после коммита, 'queue' — воркер manage.py process_image_jobs,
+# 'sync' — сразу в запросе.
+IMAGE_JOBS_MODE = os.environ.get('IMAGE_JOBS_MODE', 'thread')
+IMAGE_JOBS_WORKERS = int(os.environ.get('IMAGE_JOBS_WORKERS', 2))
+IMAGE_JOBS_MAX_ATTEMPTS = int(os.environ.get('IMAGE_JOBS_MAX_ATTEMPTS', 3))
+IMAGE_JOBS_RETRY_DELAY = float(os.environ.get('IMAGE_JOBS_RETRY_DELAY', 1))
+# Сколько секунд хранить выполненные задачи (удаляются воркером
+# process_image_jobs и командой purge_image_jobs).
+IMAGE_JOBS_KEEP_DONE = int(os.environ.get('IMAGE_JOBS_KEEP_DONE', 86400))
+
+# Размеры (вписываются в рамку с сохранением пропорций) и форматы копий
+# изображений продуктов с качеством сжатия. Форматы, которые не
+# поддерживает установленный Pillow, пропускаются.
+PRODUCT_IMAGE_SIZES = {
+    'small': (150, 150),
+    'medium': (300, 300),
+    'large': (800, 800),
+}
+PRODUCT_IMAGE_FORMATS = {
+    'avif': 60,
+    'webp': 80,
+    'jpeg': 90,
+}
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -0,0 +1,107 @@
+"""
+Генератор синтетического каталога для бенчмарков.
+
+Каталог из n продуктов получает около √n / 10 категорий по 2–12
+подкатегорий; продукты распределяются по подкатегориям неравномерно (как
+в реальном магазине, где несколько подкатегорий заметно крупнее).
+Названия собираются из небольшого словаря, поэтому поиск находит
+совпадения. Все строки создаются пакетами bulk_create, после чего
+отправляется catalog_changed, как после импорта каталога.
+"""
+import random
+from decimal import Decimal
+from math import isqrt
+
+from django.contrib.auth import get_user_model
+
+from products.models import Cart, CartItem, Category, Product, Subcategory
+from products.signals import catalog_changed
+
+BATCH_SIZE = 10_000
+CART_SIZES = (1, 3, 10, 50)
+ADJECTIVES = ('свежее', 'домашнее', 'фермерское', 'отборное', 'сладкое',
+              'копченое', 'диетическое', 'органическое')
+NOUNS = ('молоко', 'масло', 'печенье', 'варенье', 'мясо', 'сыр', 'хлеб',
+         'мороженое', 'пюре', 'филе')
+
+User = get_user_model()
+
+
+def seed_catalog(products, carts=40, seed=0):
+    """
+    Создает каталог из products продуктов и carts пользователей с
+    корзинами размеров CART_SIZES. Возвращает словарь с созданными
+    категориями, подкатегориями и пользователями.
+    """
+    rng = random.Random(seed)
+    categories = Category.objects.bulk_create(
+        Category(name=f'Категория {index}', slug=f'category-{index}',
+                 image='categories/category_default.jpg')
+        for index in range(max(1, isqrt(products) // 10))
+    )
+    subcategories = Subcategory.objects.bulk_create(
+        Subcategory(name=f'Подкатегория {category.pk}-{index}',
+                    slug=f'subcategory-{category.pk}-{index}',
+                    category=category,
+                    image='subcategories/subcategory_default.jpg')
+        for category in categories
+        for index in range(rng.randint(2, 12))
+    )
+    weights = [rng.paretovariate(1.5) for _ in subcategories]
+
+    for start in range(0, products, BATCH_SIZE):
+        Product.objects.bulk_create(
+            _product(index, subcategory, rng)
+            for index, subcategory in zip(
+                range(start, min(start + BATCH_SIZE, products)),
+                rng.choices(subcategories, weights,
+                            k=min(BATCH_SIZE, products - start))
+            )
+        )
+
+    users = User.objects.bulk_create(
+        User(username=f'bench-{index}') for index in range(carts)
+    )
+    product_ids = list(
+        Product.objects.order_by('pk').values_list('pk', flat=True)[:1000]
+    )
+    rng.shuffle(product_ids)
+    cart_objects = Cart.objects.bulk_create(Cart(user=user) for user in users)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product_id=product_id,
+                 quantity=rng.randint(1, 5))
+        for index, cart in enumerate(cart_objects)
+        for product_id in product_ids[:CART_SIZES[index % len(CART_SIZES)]]
+    )
+
+    for model in (Category, Subcategory, Product):
+        catalog_changed.send(sender=model)
+    return {
+        'categories': categories,
+        'subcategories': subcategories,
+        'users': users,
+        'product_ids': product_ids,
+    }
+
+
+def _product(index, subcategory, rng):
+    name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {index}'
+    return Product(
+        name=name.capitalize(),
+        slug=f'product-{index}',
+        category_id=subcategory.category_id,
+        subcategory=subcategory,
+        price=Decimal(rng.randint(1000, 500000)) / 100,
+        image='products/default.jpg'
+    )
+
+
+def clear_catalog():
+    """Удаляет синтетический каталог и пользователей бенчмарка."""
+    Cart.objects.all().delete()
+    Product.objects.all().delete()
+    Subcategory.objects.all().delete()
+    Category.objects.all().delete()
+    User.objects.filter(username__startswith='bench-').delete()
+    for model in (Category, Subcategory, Product):
+        catalog_changed.send(sender=model)
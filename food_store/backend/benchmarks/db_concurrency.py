@@ -0,0 +1,212 @@
+"""
+Нагрузочный бенчмарк профилей базы данных.
+
+Потоки-читатели запрашивают страницу каталога с категориями, потоки-
+писатели одновременно добавляют товары в корзины (add_quantities в
+транзакции). Для каждого профиля выводятся операции в секунду, медиана и
+95-й перцентиль задержки, а также число ошибок database is locked.
+
+Профили:
+    sqlite-default — SQLite без настройки (журнал DELETE, без ожидания);
+    sqlite-tuned — WAL, synchronous=NORMAL, busy timeout, mmap;
+    postgresql — пул соединений Django 5.1; параметры подключения берутся
+    из переменных POSTGRES_*/DB_HOST/DB_PORT, профиль пропускается, если
+    сервер недоступен.
+
+Каждый профиль запускается в отдельном процессе со своими настройками и
+временной тестовой базой.
+
+Запуск: python -m benchmarks.db_concurrency [--readers 8] [--writers 4]
+        [--duration 5] [профили...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROFILES = {
+    'sqlite-default': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNED': 'false'},
+    'sqlite-tuned': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNED': 'true'},
+    'postgresql': {'DB_ENGINE': 'postgresql', 'DB_POOL': 'true'},
+}
+PRODUCTS = 200
+CARTS = 50
+PAGE_SIZE = 20
+
+
+def seed():
+    from django.contrib.auth import get_user_model
+
+    from products.models import Cart, Category, Product, Subcategory
+
+    category = Category.objects.create(name='Bench', slug='bench')
+    subcategory = Subcategory.objects.create(name='Bench', slug='bench',
+                                             category=category)
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {index}', slug=f'product-{index}',
+                category=category, subcategory=subcategory,
+                price='19.99', image='products/default.jpg')
+        for index in range(PRODUCTS)
+    )
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(username=f'bench-{index}')
+        for index in range(CARTS)
+    )
+    carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+    return [product.pk for product in products], [cart.pk for cart in carts]
+
+
+def read(index, product_ids, cart_ids):
+    from products.models import Product
+
+    offset = index * PAGE_SIZE % PRODUCTS
+    list(Product.objects.select_related('category', 'subcategory')
+         .order_by('id')[offset:offset + PAGE_SIZE])
+
+
+def write(index, product_ids, cart_ids):
+    from django.db import transaction
+
+    from products.models import CartItem
+
+    with transaction.atomic():
+        CartItem.objects.add_quantities(
+            cart_ids[index % len(cart_ids)],
+            {product_ids[index % len(product_ids)]: 1}
+        )
+
+
+def worker(operation, deadline, product_ids, cart_ids, results):
+    from django.db import OperationalError, connection
+
+    latencies, errors, index = [], 0, 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(index, product_ids, cart_ids)
+        except OperationalError:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+        index += 1
+    connection.close()
+    results.append((operation.__name__, latencies, errors))
+
+
+def summarize(name, results, duration):
+    latencies = sorted(
+        latency for kind, values, _ in results if kind == name
+        for latency in values
+    )
+    errors = sum(count for kind, _, count in results if kind == name)
+    if not latencies:
+        return {'ops': 0, 'p50_ms': None, 'p95_ms': None, 'errors': errors}
+    return {
+        'ops': round(len(latencies) / duration),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(
+            latencies[int(len(latencies) * 0.95) - 1] * 1000, 2
+        ),
+        'errors': errors,
+    }
+
+
+def run_profile(readers, writers, duration):
+    """Выполняет нагрузку в текущем процессе и печатает итоги в JSON."""
+    import django
+    from django.core.exceptions import ImproperlyConfigured
+
+    try:
+        django.setup()
+    except ImproperlyConfigured as error:
+        print(json.dumps({'skipped': str(error)}))
+        return
+    from django.db import OperationalError, connection
+
+    test_name = None
+    if connection.vendor == 'sqlite':
+        test_name = tempfile.mktemp(suffix='.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0)
+    except OperationalError as error:
+        print(json.dumps({'skipped': str(error).strip()}))
+        return
+    try:
+        product_ids, cart_ids = seed()
+        connection.close()
+        results = []
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=worker, args=(
+                operation, deadline, product_ids, cart_ids, results
+            ))
+            for operation, count in ((read, readers), (write, writers))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(json.dumps({
+            'read': summarize('read', results, duration),
+            'write': summarize('write', results, duration),
+        }))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if test_name:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(test_name + suffix):
+                    os.remove(test_name + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('profiles', nargs='*', default=list(PROFILES),
+                        help=f'Профили: {", ".join(PROFILES)}.')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--run', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    unknown = set(args.profiles) - set(PROFILES)
+    if unknown:
+        parser.error(f'неизвестные профили: {", ".join(sorted(unknown))}')
+
+    if args.run:
+        run_profile(args.readers, args.writers, args.duration)
+        return
+
+    print(f'{args.readers} readers, {args.writers} writers, '
+          f'{args.duration:g} s')
+    for profile in args.profiles:
+        env = {**os.environ, **PROFILES[profile],
+               'DJANGO_SETTINGS_MODULE': 'backend.settings'}
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.db_concurrency', '--run',
+             '--readers', str(args.readers), '--writers', str(args.writers),
+             '--duration', str(args.duration)],
+            env=env, capture_output=True, text=True
+        )
+        if output.returncode:
+            print(f'{profile:>15}: failed\n{output.stderr}')
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if 'skipped' in result:
+            print(f'{profile:>15}: skipped ({result["skipped"]})')
+            continue
+        for kind in ('read', 'write'):
+            stats = result[kind]
+            print(f'{profile:>15} {kind:>5}: {stats["ops"]:>6} ops/s '
+                  f'p50 {stats["p50_ms"]} ms p95 {stats["p95_ms"]} ms '
+                  f'errors {stats["errors"]}')
+
+
+if __name__ == '__main__':
+    main()
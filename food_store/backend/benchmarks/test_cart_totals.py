@@ -0,0 +1,78 @@
+"""
+Бенчмарк отображения корзины.
+
+Сравнивает прежний путь (prefetch товаров, итоги суммируются в Python,
+категория и подкатегория продукта загружаются отдельными запросами) с
+Cart.objects.with_totals() и select_related на корзинах из 1, 50 и 500
+позиций: число запросов и время сериализации.
+
+Запуск: python -m pytest benchmarks/test_cart_totals.py -s
+"""
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import CaptureQueriesContext
+
+from api.serializers import CartSerializer
+from products.models import Cart, CartItem, Category, Product, Subcategory
+
+User = get_user_model()
+
+ROUNDS = 20
+
+
+def legacy_cart(user):
+    cart = Cart.objects.prefetch_related('items__product').get(user=user)
+    return CartSerializer(cart).data
+
+
+def current_cart(user):
+    items = CartItem.objects.select_related(
+        'product__category', 'product__subcategory'
+    ).order_by('id')
+    cart = Cart.objects.with_totals().prefetch_related(
+        Prefetch('items', queryset=items)
+    ).get(user=user)
+    return CartSerializer(cart).data
+
+
+def measure(render, user):
+    with CaptureQueriesContext(connection) as queries:
+        data = render(user)
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        render(user)
+    return data, len(queries), (time.perf_counter() - started) / ROUNDS
+
+
+@pytest.mark.parametrize('lines', [1, 50, 500])
+@pytest.mark.django_db
+def test_cart_totals(lines):
+    category = Category.objects.create(name='Bench', slug='bench')
+    subcategory = Subcategory.objects.create(name='Bench', slug='bench',
+                                             category=category)
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {index}', slug=f'product-{index}',
+                category=category, subcategory=subcategory,
+                price='19.99', image='products/default.jpg')
+        for index in range(lines)
+    )
+    user = User.objects.create_user(username='bench', password='bench')
+    cart = Cart.objects.create(user=user)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=product, quantity=index % 7 + 1)
+        for index, product in enumerate(products)
+    )
+
+    legacy_data, legacy_queries, legacy_time = measure(legacy_cart, user)
+    data, queries, elapsed = measure(current_cart, user)
+    print(f'\n{lines:>4} lines: legacy {legacy_queries:>5} queries '
+          f'{legacy_time * 1000:8.2f} ms | current {queries} queries '
+          f'{elapsed * 1000:8.2f} ms')
+
+    assert data['total_quantity'] == legacy_data['total_quantity']
+    assert data['total_price'] == legacy_data['total_price']
+    assert queries == 2
@@ -0,0 +1,377 @@
+"""
+Бенчмарк маршрутов api/urls.py на синтетических каталогах.
+
+Для каждого размера каталога (benchmarks.catalog.seed_catalog) и каждого
+сценария выполняется BENCHMARK_ROUNDS запросов через тестовый клиент и
+измеряются перцентили задержки p50/p95/p99, число SQL-запросов и пик
+выделенной памяти (tracemalloc, отдельным запросом). Ответы каталога
+запрашиваются с уникальным параметром, поэтому кэш ответов не скрывает
+стоимость их построения. Сценарии каталога выполняются в конфигурации
+по умолчанию (версии таблиц в базе) и с общим кэшем
+(CATALOG_CACHE_SHARED, ключ результата с суффиксом :shared-cache).
+
+Покрыты все маршруты, кроме activation и resend_activation djoser: без
+SEND_ACTIVATION_EMAIL они только отвечают ошибкой.
+
+Результаты сравниваются с базовыми значениями из
+BENCHMARK_BASELINE_DIR/endpoints-<размер>.json. По умолчанию тест падает,
+только если SQL-запросов больше базового числа плюс
+BENCHMARK_QUERY_BUDGET: число запросов не зависит от машины. Время и
+память в базовом файле из репозитория сняты на машине разработчика и
+сравниваются, только если заданы:
+    - BENCHMARK_LATENCY_BUDGET — во сколько раз медиана задержки может
+      превышать базовую (медиана, а не p95, устойчива к паузам сборщика
+      мусора и соседней нагрузке);
+    - BENCHMARK_MEMORY_BUDGET — во сколько раз пик памяти может
+      превышать базовый.
+Задавайте их вместе с базовыми файлами, записанными на той же машине,
+например в CI: прогон базовой ветки с BENCHMARK_UPDATE_BASELINE=1 и
+BENCHMARK_BASELINE_DIR во временном каталоге, затем прогон изменений
+с тем же каталогом. Если базового файла нет или задан
+BENCHMARK_UPDATE_BASELINE=1, он записывается по результатам прогона.
+
+Переменные окружения:
+    BENCHMARK_SIZES — размеры каталогов через запятую (10,10000; для
+    1000000 заполнение занимает несколько минут);
+    BENCHMARK_ROUNDS — запросов на сценарий (30).
+
+Запуск: python -m pytest benchmarks/test_endpoints.py -s
+"""
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from djoser.utils import encode_uid
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .catalog import clear_catalog, seed_catalog
+from products.models import CartItem
+
+BASELINE_DIR = Path(os.environ.get(
+    'BENCHMARK_BASELINE_DIR', Path(__file__).resolve().parent / 'baselines'
+))
+SIZES = [
+    int(size) for size in
+    os.environ.get('BENCHMARK_SIZES', '10,10000').split(',')
+]
+ROUNDS = int(os.environ.get('BENCHMARK_ROUNDS', 30))
+LATENCY_BUDGET = float(os.environ.get('BENCHMARK_LATENCY_BUDGET') or 0)
+QUERY_BUDGET = int(os.environ.get('BENCHMARK_QUERY_BUDGET', 0))
+MEMORY_BUDGET = float(os.environ.get('BENCHMARK_MEMORY_BUDGET') or 0)
+UPDATE_BASELINE = os.environ.get('BENCHMARK_UPDATE_BASELINE') == '1'
+PASSWORD = 'benchmark-password'
+EMAIL = 'bench@example.com'
+SHARED_CACHE_SUFFIX = ':shared-cache'
+
+User = get_user_model()
+
+
+def catalog_request(name, **params):
+    def scenario(context, index, **kwargs):
+        url = reverse(name, kwargs={
+            key: value(context) for key, value in kwargs.items()
+        }) if kwargs else reverse(name)
+        return 'get', url, {**params, '_': index}
+    return scenario
+
+
+def cart_item(context, index):
+    return context['cart_products'][index % len(context['cart_products'])]
+
+
+def prepare_remove(context, index):
+    product_id = context['product_ids'][index % len(context['product_ids'])]
+    CartItem.objects.add_quantity(context['cart'].pk, product_id, 1)
+    return 'delete', reverse('api:cart-remove'), {'product_id': product_id}
+
+
+def prepare_clear(context, index):
+    CartItem.objects.add_quantities(
+        context['cart'].pk, dict.fromkeys(context['product_ids'][:20], 1)
+    )
+    return 'delete', reverse('api:cart-clear'), {}
+
+
+def prepare_user(context, index):
+    """Отдельный пользователь с токеном для сценариев, удаляющих их."""
+    user = User.objects.create_user(f'bench-temp-{index}', EMAIL, PASSWORD)
+    return user, Token.objects.create(user=user).key
+
+
+def prepare_logout(context, index):
+    _, token = prepare_user(context, index)
+    return 'post', reverse('api:logout'), {}, token
+
+
+def prepare_user_delete(context, index):
+    user, token = prepare_user(context, index)
+    return (
+        'delete', reverse('api:user-detail', kwargs={'id': user.pk}),
+        {'current_password': PASSWORD}, token
+    )
+
+
+def confirmation(context):
+    """uid и токен из письма djoser для текущего состояния пользователя."""
+    user = User.objects.get(pk=context['user'].pk)
+    return {
+        'uid': encode_uid(user.pk),
+        'token': default_token_generator.make_token(user),
+    }
+
+
+SCENARIOS = {
+    'api-root': lambda context, index: (
+        'get', reverse('api:api-root'), {}
+    ),
+    'category-list': catalog_request('api:category-list'),
+    'category-detail': lambda context, index: catalog_request(
+        'api:category-detail'
+    )(context, index, pk=lambda context: context['category'].slug),
+    'category-products': lambda context, index: catalog_request(
+        'api:category-products'
+    )(context, index, pk=lambda context: context['category'].slug),
+    'product-list': catalog_request('api:product-list'),
+    'product-list-cursor': catalog_request('api:product-list',
+                                           pagination='cursor'),
+    'product-list-filtered': lambda context, index: catalog_request(
+        'api:product-list', subcategory=context['subcategory'].slug,
+        min_price=100, max_price=3000, ordering='-price'
+    )(context, index),
+    'product-search': catalog_request('api:product-list',
+                                      search='домашнее молоко'),
+    'product-detail': lambda context, index: (
+        'get', reverse('api:product-detail', kwargs={
+            'pk': f'product-{index % context["size"]}'
+        }), {'_': index}
+    ),
+    'cart-list': lambda context, index: (
+        'get', reverse('api:cart-list'), {}
+    ),
+    'cart-list-compact': lambda context, index: (
+        'get', reverse('api:cart-list'), {'view': 'compact'}
+    ),
+    'cart-add': lambda context, index: (
+        'post', reverse('api:cart-add'),
+        {'product_id': cart_item(context, index), 'quantity': 1}
+    ),
+    'cart-update-quantity': lambda context, index: (
+        'put', reverse('api:cart-update-quantity'),
+        {'product_id': cart_item(context, index), 'quantity': index + 1}
+    ),
+    'cart-remove': prepare_remove,
+    'cart-batch': lambda context, index: (
+        'post', reverse('api:cart-batch'), {'operations': [
+            {'op': 'add', 'product_id': product_id, 'quantity': 1}
+            for product_id in context['product_ids'][:10]
+        ]}
+    ),
+    'cart-clear': prepare_clear,
+    'token-login': lambda context, index: (
+        'post', reverse('api:login'),
+        {'username': context['user'].username, 'password': PASSWORD}
+    ),
+    'token-logout': prepare_logout,
+    'user-me': lambda context, index: (
+        'get', reverse('api:user-me'), {}
+    ),
+    'user-update': lambda context, index: (
+        'patch', reverse('api:user-me'), {'first_name': f'Bench {index}'}
+    ),
+    'user-list': lambda context, index: (
+        'get', reverse('api:user-list'), {}
+    ),
+    'user-detail': lambda context, index: (
+        'get', reverse('api:user-detail', kwargs={'id': context['user'].pk}),
+        {}
+    ),
+    'user-create': lambda context, index: (
+        'post', reverse('api:user-list'),
+        {'username': f'bench-new-{index}', 'email': EMAIL,
+         'password': PASSWORD}
+    ),
+    'user-delete': prepare_user_delete,
+    'set-password': lambda context, index: (
+        'post', reverse('api:user-set-password'),
+        {'new_password': PASSWORD, 'current_password': PASSWORD}
+    ),
+    'set-username': lambda context, index: (
+        'post', reverse('api:user-set-username'),
+        {'new_username': f'bench-renamed-{index}',
+         'current_password': PASSWORD}
+    ),
+    'reset-password': lambda context, index: (
+        'post', reverse('api:user-reset-password'), {'email': EMAIL}
+    ),
+    'reset-password-confirm': lambda context, index: (
+        'post', reverse('api:user-reset-password-confirm'),
+        {**confirmation(context), 'new_password': PASSWORD}
+    ),
+    'reset-username': lambda context, index: (
+        'post', reverse('api:user-reset-username'), {'email': EMAIL}
+    ),
+    'reset-username-confirm': lambda context, index: (
+        'post', reverse('api:user-reset-username-confirm'),
+        {**confirmation(context), 'new_username': f'bench-reset-{index}'}
+    ),
+}
+# Сценарии каталога, которые дополнительно выполняются с общим кэшем.
+CATALOG_SCENARIOS = [
+    name for name in SCENARIOS if name.startswith(('category', 'product'))
+]
+PARAMS = [pytest.param(name, False, id=name) for name in SCENARIOS] + [
+    pytest.param(name, True, id=name + SHARED_CACHE_SUFFIX)
+    for name in CATALOG_SCENARIOS
+]
+RESULTS = {}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def baseline_path(size):
+    return BASELINE_DIR / f'endpoints-{size}.json'
+
+
+def load_baseline(size):
+    path = baseline_path(size)
+    if UPDATE_BASELINE or not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}')
+def catalog(request, django_db_setup, django_db_blocker):
+    """Заполняет тестовую базу каталогом один раз на каждый размер."""
+    with django_db_blocker.unblock():
+        started = time.perf_counter()
+        data = seed_catalog(request.param)
+        print(f'\nКаталог из {request.param} продуктов заполнен за '
+              f'{time.perf_counter() - started:.1f} с')
+        user = data['users'][-1]
+        user.email = EMAIL
+        user.set_password(PASSWORD)
+        user.save()
+        token, _ = Token.objects.get_or_create(user=user)
+        cart = user.shopping_cart
+        context = {
+            **data,
+            'size': request.param,
+            'user': user,
+            'token': token.key,
+            'cart': cart,
+            'cart_products': list(
+                cart.items.values_list('product_id', flat=True)
+            ),
+            'category': data['categories'][0],
+            'subcategory': data['subcategories'][0],
+            'baseline': load_baseline(request.param),
+        }
+    RESULTS[request.param] = {}
+    yield context
+
+    path = baseline_path(request.param)
+    if UPDATE_BASELINE or not path.exists():
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path.write_text(json.dumps(RESULTS[request.param], indent=2,
+                                   ensure_ascii=False, sort_keys=True)
+                        + '\n')
+    with django_db_blocker.unblock():
+        clear_catalog()
+
+
+def send(client, method, url, data, token=None):
+    if token is not None:
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+    if method == 'get':
+        return client.get(url, data)
+    return getattr(client, method)(url, data, format='json')
+
+
+@pytest.mark.parametrize('name, shared', PARAMS)
+@pytest.mark.django_db
+def test_endpoint(catalog, name, shared, settings):
+    settings.PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.MD5PasswordHasher'
+    ]
+    if shared:
+        # Как в конфигурации с redis: версии таблиц берутся из кэша.
+        settings.CATALOG_CACHE_SHARED = True
+    # Письма сброса пароля и имени djoser строит по этим шаблонам ссылок;
+    # в настройках проекта их нет, и без них маршруты отвечают ошибкой.
+    settings.DJOSER = {
+        **getattr(settings, 'DJOSER', {}),
+        'PASSWORD_RESET_CONFIRM_URL': 'reset/password/{uid}/{token}',
+        'USERNAME_RESET_CONFIRM_URL': 'reset/username/{uid}/{token}',
+    }
+    catalog['user'].set_password(PASSWORD)
+    catalog['user'].save()
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + catalog['token'])
+    scenario = SCENARIOS[name]
+
+    send(client, *scenario(catalog, 0))
+    latencies = []
+    for index in range(1, ROUNDS + 1):
+        request = scenario(catalog, index)
+        started = time.perf_counter()
+        response = send(client, *request)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code < 400, response.content
+
+    request = scenario(catalog, ROUNDS + 1)
+    with CaptureQueriesContext(connection) as queries:
+        send(client, *request)
+    # Журнал запросов очищается в начале каждого запроса (request_started).
+    query_count = len(queries)
+    request = scenario(catalog, ROUNDS + 2)
+    tracemalloc.start()
+    try:
+        send(client, *request)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'queries': query_count,
+        'peak_kib': round(peak / 1024, 1),
+    }
+    key = name + SHARED_CACHE_SUFFIX if shared else name
+    RESULTS[catalog['size']][key] = result
+    print(f'\n{catalog["size"]:>8} {key:<34} p50 {result["p50_ms"]:8.2f} '
+          f'p95 {result["p95_ms"]:8.2f} p99 {result["p99_ms"]:8.2f} ms, '
+          f'{result["queries"]:>3} queries, {result["peak_kib"]:9.1f} KiB')
+
+    baseline = catalog['baseline'].get(key)
+    if baseline is None:
+        return
+    assert result['queries'] <= baseline['queries'] + QUERY_BUDGET, (
+        f'{key}: {result["queries"]} SQL-запросов, базовое значение '
+        f'{baseline["queries"]}'
+    )
+    if LATENCY_BUDGET:
+        assert result['p50_ms'] <= baseline['p50_ms'] * LATENCY_BUDGET, (
+            f'{key}: p50 {result["p50_ms"]} мс, базовое значение '
+            f'{baseline["p50_ms"]} мс'
+        )
+    if MEMORY_BUDGET:
+        assert result['peak_kib'] <= baseline['peak_kib'] * MEMORY_BUDGET, (
+            f'{key}: пик памяти {result["peak_kib"]} КиБ, базовое значение '
+            f'{baseline["peak_kib"]} КиБ'
+        )
@@ -0,0 +1,99 @@
+"""
+Бенчмарк генерации уменьшенных изображений продукта.
+
+Сравнивает прежнюю реализацию (оригинал открывается и декодируется для
+каждого размера) с каскадной (products.images.resize_cascade) по времени
+CPU и пиковому потреблению памяти на многомегапиксельных JPEG.
+
+Запуск: python -m pytest benchmarks/test_image_resizing.py -s
+"""
+import multiprocessing
+import resource
+import time
+
+import pytest
+from PIL import Image
+
+from products.images import get_sizes, resize_cascade
+
+ROUNDS = 3
+
+
+def legacy_resize(original_path):
+    """Прежняя реализация Product._resize_image для каждого размера."""
+    resized = {}
+    for size_name, size in get_sizes().items():
+        img = Image.open(original_path)
+        img = img.convert('RGB')
+        img.thumbnail(size, Image.LANCZOS)
+        resized[size_name] = img
+    return resized
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_resize,
+    'cascade': resize_cascade,
+}
+
+
+def _peak_rss():
+    """Пиковый RSS процесса в КиБ (VmHWM, либо ru_maxrss вне Linux)."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def _measure(name, original_path, queue):
+    _reset_peak_rss()
+    baseline = _peak_rss()
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        IMPLEMENTATIONS[name](original_path)
+    cpu = (time.process_time() - started) / ROUNDS
+    queue.put((cpu, (_peak_rss() - baseline) / 1024))
+
+
+def measure(name, original_path):
+    """Запускает реализацию в отдельном процессе, чтобы замерить память."""
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_measure,
+                              args=(name, original_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+@pytest.fixture(params=[(4000, 3000), (6000, 4000)],
+                ids=lambda size: f'{size[0] * size[1] // 10**6}MP')
+def original(request, tmp_path):
+    width, height = request.param
+    path = tmp_path / 'original.jpg'
+    Image.effect_mandelbrot((width, height), (-2, -1.2, 1, 1.2), 64).convert(
+        'RGB'
+    ).save(path, format='JPEG', quality=92)
+    return str(path)
+
+
+def test_cascade_resizing_is_cheaper(original):
+    results = {name: measure(name, original) for name in IMPLEMENTATIONS}
+    for name, (cpu, memory) in results.items():
+        print(f'\n{name:>8}: cpu {cpu * 1000:8.1f} ms, '
+              f'peak memory +{memory:7.1f} MiB')
+
+    assert results['cascade'][0] < results['legacy'][0]
+    assert results['cascade'][1] <= results['legacy'][1]
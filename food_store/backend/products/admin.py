@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Category, Product, Subcategory
+from .models import Category, ImageJob, Product, Subcategory
 
 
 @admin.register(Category)
@@ -25,3 +25,11 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('name', 'subcategory__name',
                      'subcategory__category__name')
     list_filter = ('subcategory', 'subcategory__category')
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('product', 'status', 'attempts', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('product', 'attempts', 'error', 'created_at',
+                       'updated_at')
@@ -0,0 +1,165 @@
+import hashlib
+import os
+
+from django.conf import settings
+from PIL import Image
+
+FORMAT_EXTENSIONS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+    'avif': 'avif',
+}
+
+
+def get_sizes():
+    """Возвращает размеры копий из настройки PRODUCT_IMAGE_SIZES."""
+    return {
+        size_name: tuple(size)
+        for size_name, size in settings.PRODUCT_IMAGE_SIZES.items()
+    }
+
+
+def get_formats():
+    """
+    Возвращает форматы копий из настройки PRODUCT_IMAGE_FORMATS, которые
+    поддерживает установленный Pillow, вместе с качеством сжатия.
+
+    JPEG поддерживается всегда и используется как запасной формат.
+    """
+    Image.init()
+    return {
+        image_format: quality
+        for image_format, quality in settings.PRODUCT_IMAGE_FORMATS.items()
+        if image_format.upper() in Image.SAVE
+    }
+
+
+def _fit(img, size):
+    """Уменьшает изображение до размеров size с сохранением пропорций."""
+    ratio = min(size[0] / img.width, size[1] / img.height)
+    if ratio >= 1:
+        return img
+    return img.resize(
+        (max(1, round(img.width * ratio)), max(1, round(img.height * ratio))),
+        Image.LANCZOS,
+        reducing_gap=3.0
+    )
+
+
+def resize_cascade(original_path, sizes=None):
+    """
+    Строит уменьшенные копии изображения, декодируя оригинал один раз.
+
+    Для JPEG декодер через draft() сразу масштабирует изображение до
+    ближайшего размера не меньше самой большой копии. Копии строятся
+    каскадом от большей к меньшей: каждая следующая получается из
+    предыдущей, а не из оригинала.
+
+    Возвращает словарь {название размера: PIL.Image}.
+    """
+    sizes = sizes or get_sizes()
+    ordered = sorted(sizes.items(), key=lambda item: item[1], reverse=True)
+    with Image.open(original_path) as img:
+        img.draft('RGB', ordered[0][1])
+        current = img.convert('RGB')
+
+    resized = {}
+    for size_name, size in ordered:
+        current = _fit(current, size)
+        resized[size_name] = current
+    return resized
+
+
+def file_digest(path):
+    """Возвращает SHA-256 содержимого файла, читая его потоково."""
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def derivative_paths(base_name, sizes=None, formats=None):
+    """
+    Возвращает пути копий относительно MEDIA_ROOT:
+    {название размера: {формат: путь}}.
+
+    В имя файла входят рамка размера и качество сжатия, поэтому после
+    изменения PRODUCT_IMAGE_SIZES или PRODUCT_IMAGE_FORMATS копии
+    строятся заново, а не берутся из файлов со старыми настройками.
+    """
+    sizes = sizes or get_sizes()
+    formats = formats or get_formats()
+    return {
+        size_name: {
+            image_format: (
+                f'products/{size_name}/{base_name}_{size_name}_'
+                f'{width}x{height}_q{quality}.'
+                f'{FORMAT_EXTENSIONS.get(image_format, image_format)}'
+            )
+            for image_format, quality in formats.items()
+        }
+        for size_name, (width, height) in sizes.items()
+    }
+
+
+def _full_path(path):
+    return os.path.join(settings.MEDIA_ROOT, path)
+
+
+def derivatives_exist(base_name, sizes=None, formats=None):
+    """Проверяет, что все копии с этим именем уже записаны на диск."""
+    return all(
+        os.path.exists(_full_path(path))
+        for paths in derivative_paths(base_name, sizes, formats).values()
+        for path in paths.values()
+    )
+
+
+def _variants(paths, dimensions):
+    return {
+        size_name: {
+            'width': dimensions[size_name][0],
+            'height': dimensions[size_name][1],
+            'formats': formats,
+        }
+        for size_name, formats in paths.items()
+    }
+
+
+def save_derivatives(original_path, base_name, sizes=None, formats=None):
+    """
+    Генерирует и записывает все копии во всех форматах за один проход.
+
+    Возвращает словарь вариантов:
+    {название размера: {'width', 'height', 'formats': {формат: путь}}}.
+    """
+    formats = formats or get_formats()
+    paths = derivative_paths(base_name, sizes, formats)
+    dimensions = {}
+    for size_name, img in resize_cascade(original_path, sizes).items():
+        dimensions[size_name] = img.size
+        for image_format, quality in formats.items():
+            full_path = _full_path(paths[size_name][image_format])
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            img.save(full_path, format=image_format.upper(), quality=quality)
+    return _variants(paths, dimensions)
+
+
+def ensure_derivatives(original_path, sizes=None, formats=None,
+                       force=False):
+    """
+    Возвращает хэш оригинала и варианты его уменьшенных копий.
+
+    Копии именуются по SHA-256 содержимого оригинала, поэтому продукты с
+    одинаковыми изображениями используют одни и те же файлы, а повторная
+    генерация уже существующих копий пропускается (если не задан force).
+    """
+    digest = file_digest(original_path)
+    if force or not derivatives_exist(digest, sizes, formats):
+        return digest, save_derivatives(original_path, digest, sizes,
+                                        formats)
+
+    paths = derivative_paths(digest, sizes, formats)
+    dimensions = {}
+    for size_name, size_paths in paths.items():
+        with Image.open(_full_path(next(iter(size_paths.values())))) as img:
+            dimensions[size_name] = img.size
+    return digest, _variants(paths, dimensions)
@@ -0,0 +1,101 @@
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from backend.constants import DEFAULT_PRODUCT_IMAGES
+from products.images import derivative_paths, get_formats, get_sizes
+from products.models import Product
+from products.signals import catalog_changed
+from products.tasks import derivatives_pool, render_derivatives
+
+
+class Command(BaseCommand):
+    help = ('Генерирует недостающие варианты изображений продуктов '
+            'параллельно на всех ядрах процессора.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов (по умолчанию — число ядер).'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=500,
+            help='Сколько продуктов обрабатывать и сохранять за раз.'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перегенерировать варианты всех продуктов, перезаписав '
+                 'существующие файлы копий.'
+        )
+
+    def _is_up_to_date(self, product, sizes, formats):
+        """
+        Проверяет, что варианты продукта построены по текущим размерам,
+        форматам и качеству (они входят в пути копий).
+        """
+        if not product.image_hash:
+            return False
+        variants = product.image_variants or {}
+        return {
+            size_name: variant.get('formats')
+            for size_name, variant in variants.items()
+        } == derivative_paths(product.image_hash, sizes, formats)
+
+    def handle(self, *args, **options):
+        sizes, formats = get_sizes(), get_formats()
+        started = time.monotonic()
+        updated = failed = 0
+        changed_fields = set()
+
+        with derivatives_pool(options['workers']) as pool:
+            queryset = Product.objects.exclude(
+                image__in=('', *DEFAULT_PRODUCT_IMAGES)
+            ).only(
+                'image', 'image_hash', 'image_variants', 'image_small',
+                'image_medium', 'image_large'
+            ).order_by('pk')
+            last_pk = 0
+            while True:
+                batch = list(
+                    queryset.filter(pk__gt=last_pk)[:options['batch']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                pending = [
+                    product for product in batch
+                    if options['force']
+                    or not self._is_up_to_date(product, sizes, formats)
+                ]
+                results = pool.map(
+                    partial(render_derivatives, force=options['force']),
+                    [product.image.path for product in pending]
+                )
+
+                changed, fields = [], set()
+                for product, (digest, variants, error) in zip(pending,
+                                                              results):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'{product.image.name}: {error}')
+                        continue
+                    product_fields = product.apply_image_variants(digest,
+                                                                  variants)
+                    if product_fields:
+                        changed.append(product)
+                        fields.update(product_fields)
+                if changed:
+                    Product.objects.bulk_update(changed, sorted(fields))
+                    updated += len(changed)
+                    changed_fields |= fields
+                self.stdout.write(
+                    f'Обработано до id={last_pk}: обновлено {updated}, '
+                    f'ошибок {failed}, {time.monotonic() - started:.1f} с'
+                )
+
+        if updated:
+            catalog_changed.send(sender=Product, fields=changed_fields)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обновлено {updated}, ошибок {failed}.'
+        ))
@@ -0,0 +1,394 @@
+import csv
+import json
+import time
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from backend.constants import DEFAULT_PRODUCT_IMAGES, MAX_NAME, MAX_SLUG, ZERO
+from products.models import Category, Product, Subcategory
+from products.signals import catalog_changed
+from products.tasks import derivatives_pool, render_derivatives
+
+CATEGORY_IMAGE = 'categories/category_default.jpg'
+SUBCATEGORY_IMAGE = 'subcategories/subcategory_default.jpg'
+PRODUCT_FIELDS = ['name', 'price', 'category', 'subcategory', 'updated_at']
+# При смене изображения копии прежнего сбрасываются до новой обработки.
+IMAGE_FIELDS = ['image', 'image_hash', 'image_variants', 'image_small',
+                'image_medium', 'image_large']
+
+
+def make_slug(value):
+    """
+    Строит слаг из названия, сохраняя кириллицу, и обрезает его до длины
+    поля слага.
+    """
+    return slugify(value, allow_unicode=True)[:MAX_SLUG].strip('-_')
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует каталог из CSV или JSONL. Категории, подкатегории и '
+        'продукты создаются или обновляются по слагу пакетами bulk_create, '
+        'копии изображений генерируются пулом процессов.\n'
+        'Колонки: category, category_slug, subcategory, subcategory_slug, '
+        'name, slug, price, image (путь относительно MEDIA_ROOT). '
+        'Слаги необязательны и строятся из названий (кириллица '
+        'сохраняется). Строка без image не меняет фото продукта. Строки '
+        'с ошибками (в том числе подкатегория из другой категории) '
+        'пропускаются с сообщением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .csv или .jsonl.')
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'),
+            help='Формат файла (по умолчанию — по расширению).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк сохранять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов для изображений (0 — не обрабатывать).'
+        )
+
+    def _read_rows(self, path, file_format):
+        with open(path, newline='', encoding='utf-8') as file:
+            if file_format == 'csv':
+                yield from enumerate(csv.DictReader(file), start=2)
+                return
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    yield line_number, line
+
+    def _parse(self, row):
+        """
+        Проверяет строку файла (словарь CSV или строку JSONL) и возвращает
+        данные для сохранения; ошибки строки — ValueError.
+        """
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'некорректный JSON: {error}')
+            if not isinstance(row, dict):
+                raise ValueError('строка JSONL должна быть объектом')
+        name = _text(row, 'name')
+        category = _text(row, 'category')
+        subcategory = _text(row, 'subcategory')
+        if not (name and category and subcategory):
+            raise ValueError('не указаны name, category или subcategory')
+        if max(map(len, (name, category, subcategory))) > MAX_NAME:
+            raise ValueError(f'название длиннее {MAX_NAME} символов')
+        try:
+            price = Decimal(str(row.get('price')))
+        except InvalidOperation:
+            raise ValueError(f'некорректная цена {row.get("price")!r}')
+        if not price.is_finite() or price <= ZERO:
+            raise ValueError('цена должна быть больше нуля')
+        parsed = {
+            'category': category,
+            'category_slug': (
+                _text(row, 'category_slug') or make_slug(category)
+            ),
+            'subcategory': subcategory,
+            'subcategory_slug': (
+                _text(row, 'subcategory_slug') or make_slug(subcategory)
+            ),
+            'name': name,
+            'slug': _text(row, 'slug') or make_slug(name),
+            'price': price,
+            'image': _text(row, 'image'),
+        }
+        for key in ('category_slug', 'subcategory_slug', 'slug'):
+            if not parsed[key]:
+                raise ValueError(f'не удалось построить {key} из названия')
+            if len(parsed[key]) > MAX_SLUG:
+                raise ValueError(f'{key} длиннее {MAX_SLUG} символов')
+        return parsed
+
+    def _upsert(self, model, objects, update_fields, ids):
+        """
+        Создает или обновляет объекты по слагу одним запросом и
+        дополняет словарь ids соответствиями слаг -> id.
+        """
+        if not objects:
+            return
+        model.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=update_fields
+        )
+        ids.update(
+            model.objects.filter(
+                slug__in=[obj.slug for obj in objects]
+            ).values_list('slug', 'pk')
+        )
+
+    def _category_conflicts(self, categories):
+        """
+        Возвращает слаги новых категорий, название которых уже занято
+        категорией с другим слагом (в базе или в этом же пакете).
+        """
+        owners = dict(
+            Category.objects.filter(
+                name__in=[category.name for category in categories.values()]
+            ).values_list('name', 'slug')
+        )
+        conflicts = set()
+        for slug, category in categories.items():
+            owner = owners.setdefault(category.name, slug)
+            if owner != slug:
+                conflicts.add(slug)
+                self.stderr.write(
+                    f'Строка {category.line}: категория '
+                    f'{category.name!r} уже существует со слагом {owner!r}'
+                )
+        return conflicts
+
+    def _subcategory_conflicts(self, rows):
+        """
+        Возвращает номера строк, подкатегория которых принадлежит другой
+        категории (в базе, в этом импорте или выше в пакете), и
+        запоминает категории новых подкатегорий.
+        """
+        unknown = {
+            row['subcategory_slug'] for row in rows
+        } - self.subcategory_parents.keys()
+        self.subcategory_parents.update(
+            Subcategory.objects.filter(slug__in=unknown).values_list(
+                'slug', 'category__slug'
+            )
+        )
+        conflicts = set()
+        for row in rows:
+            parent = self.subcategory_parents.setdefault(
+                row['subcategory_slug'], row['category_slug']
+            )
+            if parent != row['category_slug']:
+                conflicts.add(row['line'])
+                self.stderr.write(
+                    f'Строка {row["line"]}: подкатегория '
+                    f'{row["subcategory_slug"]!r} относится к категории '
+                    f'{parent!r}, а не {row["category_slug"]!r}'
+                )
+        return conflicts
+
+    def _save_batch(self, rows):
+        """Сохраняет пакет строк и возвращает продукты с новыми фото."""
+        categories = {}
+        for row in rows:
+            slug = row['category_slug']
+            if slug not in self.category_ids and slug not in categories:
+                categories[slug] = Category(
+                    name=row['category'], slug=slug, image=CATEGORY_IMAGE
+                )
+                categories[slug].line = row['line']
+        conflicts = self._category_conflicts(categories)
+        if conflicts:
+            skipped = [row for row in rows
+                       if row['category_slug'] in conflicts]
+            for row in skipped:
+                if row['line'] != categories[row['category_slug']].line:
+                    self.stderr.write(
+                        f'Строка {row["line"]}: пропущена из-за конфликта '
+                        f'категории {row["category"]!r}'
+                    )
+            self.counts['errors'] += len(skipped)
+            rows = [row for row in rows
+                    if row['category_slug'] not in conflicts]
+            for slug in conflicts:
+                del categories[slug]
+
+        conflicts = self._subcategory_conflicts(rows)
+        if conflicts:
+            self.counts['errors'] += len(conflicts)
+            rows = [row for row in rows if row['line'] not in conflicts]
+
+        subcategories = {}
+        products = {}
+        for row in rows:
+            if row['subcategory_slug'] not in self.subcategory_ids:
+                subcategories[row['subcategory_slug']] = row
+            products[row['slug']] = row
+
+        existing_images = dict(
+            Product.objects.filter(slug__in=products).values_list(
+                'slug', 'image'
+            )
+        )
+        new_images = {
+            slug: row['image'] for slug, row in products.items()
+            if row['image'] and row['image'] != existing_images.get(slug)
+        }
+
+        with transaction.atomic():
+            self._upsert(Category, list(categories.values()),
+                         ['name', 'updated_at'], self.category_ids)
+            self._upsert(
+                Subcategory,
+                [
+                    Subcategory(
+                        name=row['subcategory'],
+                        slug=slug,
+                        category_id=self.category_ids[row['category_slug']],
+                        image=SUBCATEGORY_IMAGE
+                    )
+                    for slug, row in subcategories.items()
+                ],
+                ['name', 'category', 'updated_at'],
+                self.subcategory_ids
+            )
+            product_ids = {}
+            # Продукты с новым фото и без него сохраняются отдельно: у
+            # вторых фото и его копии не перезаписываются.
+            for with_image in (True, False):
+                self._upsert(
+                    Product,
+                    [
+                        Product(
+                            name=row['name'],
+                            slug=slug,
+                            price=row['price'],
+                            category_id=(
+                                self.category_ids[row['category_slug']]
+                            ),
+                            subcategory_id=(
+                                self.subcategory_ids[row['subcategory_slug']]
+                            ),
+                            image=(
+                                new_images.get(slug)
+                                or DEFAULT_PRODUCT_IMAGES[0]
+                            ),
+                        )
+                        for slug, row in products.items()
+                        if (slug in new_images) == with_image
+                    ],
+                    PRODUCT_FIELDS + IMAGE_FIELDS if with_image
+                    else PRODUCT_FIELDS,
+                    product_ids
+                )
+
+        self.counts['categories'] += len(categories)
+        self.counts['subcategories'] += len(subcategories)
+        self.counts['products'] += len(products)
+        return [
+            (product_ids[slug], image) for slug, image in new_images.items()
+        ]
+
+    def _submit_images(self, pool, images):
+        for product_id, image in images:
+            path = str(self.media_root / image)
+            self.futures.append((product_id, pool.submit(render_derivatives,
+                                                         path)))
+
+    def _collect_images(self, wait=False):
+        """Сохраняет готовые копии изображений одним bulk_update."""
+        done = [
+            (product_id, future) for product_id, future in self.futures
+            if wait or future.done()
+        ]
+        if not done:
+            return
+        done_ids = {product_id for product_id, _ in done}
+        self.futures = [
+            item for item in self.futures if item[0] not in done_ids
+        ]
+        products = Product.objects.only(
+            'image_hash', 'image_variants', 'image_small', 'image_medium',
+            'image_large'
+        ).in_bulk(done_ids)
+        changed, fields = [], set()
+        for product_id, future in done:
+            digest, variants, error = future.result()
+            if error:
+                self.counts['image errors'] += 1
+                self.stderr.write(f'Продукт id={product_id}: {error}')
+                continue
+            product = products[product_id]
+            fields.update(product.apply_image_variants(digest, variants))
+            changed.append(product)
+            self.counts['images'] += 1
+        if changed and fields:
+            Product.objects.bulk_update(changed, sorted(fields))
+
+    def _report(self, started, final=False):
+        elapsed = time.monotonic() - started
+        rate = self.counts['rows'] / elapsed if elapsed else 0
+        message = (
+            f'Строк: {self.counts["rows"]} ({rate:.0f}/с), '
+            f'продуктов: {self.counts["products"]}, '
+            f'изображений: {self.counts["images"]}, '
+            f'ошибок: {self.counts["errors"]}, {elapsed:.1f} с'
+        )
+        if final:
+            message = self.style.SUCCESS(
+                f'Импорт завершен. {message}. '
+                f'Категорий: {self.counts["categories"]}, '
+                f'подкатегорий: {self.counts["subcategories"]}, '
+                f'ошибок изображений: {self.counts["image errors"]}.'
+            )
+        self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Поддерживаются только файлы CSV и JSONL.')
+
+        self.media_root = Path(settings.MEDIA_ROOT)
+        self.category_ids = {}
+        self.subcategory_ids = {}
+        self.subcategory_parents = {}
+        self.futures = []
+        self.counts = dict.fromkeys(
+            ('rows', 'errors', 'categories', 'subcategories', 'products',
+             'images', 'image errors'),
+            0
+        )
+        started = time.monotonic()
+
+        pool_context = (
+            nullcontext() if options['workers'] == 0
+            else derivatives_pool(options['workers'])
+        )
+        with pool_context as pool:
+            rows = self._read_rows(path, file_format)
+            while batch := list(islice(rows, options['batch_size'])):
+                parsed = []
+                for line_number, row in batch:
+                    try:
+                        parsed.append(
+                            {**self._parse(row), 'line': line_number}
+                        )
+                    except (ValueError, TypeError) as error:
+                        self.counts['errors'] += 1
+                        self.stderr.write(f'Строка {line_number}: {error}')
+                self.counts['rows'] += len(batch)
+
+                images = self._save_batch(parsed)
+                if pool is not None:
+                    self._submit_images(pool, images)
+                    self._collect_images()
+                self._report(started)
+            self._collect_images(wait=True)
+
+        for model in (Category, Subcategory, Product):
+            catalog_changed.send(sender=model)
+        self._report(started, final=True)
@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.models import ImageJob
+from products.tasks import process_image_job, prune_image_jobs
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь задач генерации изображений продуктов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться.'
+        )
+        parser.add_argument(
+            '--batch', type=int, default=50,
+            help='Сколько задач выбирать из очереди за раз.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Пауза между опросами пустой очереди, секунды.'
+        )
+        parser.add_argument(
+            '--requeue-after', type=int, default=600,
+            help='Вернуть в очередь задачи, зависшие в обработке дольше '
+                 'указанного числа секунд.'
+        )
+        parser.add_argument(
+            '--keep-done', type=int, default=settings.IMAGE_JOBS_KEEP_DONE,
+            help='Удалять выполненные задачи старше указанного числа '
+                 'секунд, когда очередь пуста (по умолчанию — '
+                 'IMAGE_JOBS_KEEP_DONE).'
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            ImageJob.objects.filter(
+                status=ImageJob.PROCESSING,
+                updated_at__lt=timezone.now() - timedelta(
+                    seconds=options['requeue_after']
+                )
+            ).update(status=ImageJob.PENDING, updated_at=timezone.now())
+
+            job_ids = list(
+                ImageJob.objects.filter(status=ImageJob.PENDING)
+                .values_list('pk', flat=True)[:options['batch']]
+            )
+            for job_id in job_ids:
+                if process_image_job(job_id) is not None:
+                    processed += 1
+
+            if not job_ids:
+                prune_image_jobs(
+                    timezone.now() - timedelta(seconds=options['keep_done'])
+                )
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано задач: {processed}')
+        )
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.tasks import prune_image_jobs
+
+
+class Command(BaseCommand):
+    help = ('Удаляет выполненные задачи генерации изображений. Воркер '
+            'process_image_jobs делает это сам, команда нужна в режимах '
+            'thread и sync.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.IMAGE_JOBS_KEEP_DONE,
+            help='Возраст задачи в секундах (по умолчанию — '
+                 'IMAGE_JOBS_KEEP_DONE).'
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(seconds=options['max_age'])
+        self.stdout.write(
+            f'Удалено выполненных задач: {prune_image_jobs(before)}'
+        )
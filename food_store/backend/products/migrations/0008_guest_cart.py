@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='guest_key',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True, verbose_name='Ключ гостевой корзины'),
+        ),
+        migrations.AlterField(
+            model_name='cart',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('guest_key__isnull', True), ('user__isnull', False)), models.Q(('guest_key__isnull', False), ('user__isnull', True)), _connector='OR'), name='cart_has_single_owner'),
+        ),
+    ]
@@ -1,19 +1,27 @@
-import os
-from django.conf import settings
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
-from PIL import Image
 
 from backend.constants import (
+    DEFAULT_PRODUCT_IMAGES,
+    MAX_GUEST_KEY,
+    MAX_HASH,
     MAX_NAME,
     MAX_SLUG,
+    MAX_STATUS,
     MIN_QUANTITY,
     PRICE_DECIMAL,
     PRICE_MAX,
+    PRICE_TOTAL_EXTRA_DIGITS,
     ZERO,
 )
+from .images import ensure_derivatives
 
 User = get_user_model()
 
@@ -25,6 +33,8 @@ class Category(models.Model):
                             unique=True, verbose_name='Слаг')
     image = models.ImageField(upload_to='categories/',
                               verbose_name='Изображение категории')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Категория'
@@ -51,10 +61,15 @@ class Subcategory(models.Model):
     )
     image = models.ImageField(upload_to='subcategories/',
                               verbose_name='Изображение подкатегории')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Подкатегория'
         verbose_name_plural = 'Подкатегории'
+        indexes = [
+            models.Index(fields=['name'], name='subcategory_name_idx'),
+        ]
 
     def clean(self):
         if not self.category:
@@ -78,12 +93,14 @@ class Product(models.Model):
         Category,
         on_delete=models.CASCADE,
         related_name='products',
+        db_index=False,
         verbose_name='Категория'
     )
     subcategory = models.ForeignKey(
         Subcategory,
         related_name='products',
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name='Подкатегория'
     )
     image = models.ImageField(
@@ -109,12 +126,40 @@ class Product(models.Model):
         null=True,
         verbose_name='Большое изображение'
     )
+    image_hash = models.CharField(
+        max_length=MAX_HASH,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='SHA-256 оригинального изображения'
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения'
+    )
     price = models.DecimalField(max_digits=PRICE_MAX,
                                 decimal_places=PRICE_DECIMAL)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        # Индексы под фильтры и сортировки каталога: id в конце составных
+        # индексов совпадает с завершающей сортировкой API, поэтому
+        # страница читается по индексу без отдельной сортировки. Индексы
+        # category и subcategory начинаются с внешнего ключа и заменяют
+        # его собственный индекс.
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'],
+                         name='product_category_price_idx'),
+            models.Index(fields=['subcategory', 'id'],
+                         name='product_subcategory_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
 
     def clean(self):
         if self.subcategory and self.subcategory.category != self.category:
@@ -124,57 +169,135 @@ class Product(models.Model):
             raise ValidationError('Цена должна быть больше нуля.')
         super().clean()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
 
+        self._image_changed = (
+            self.image.name != getattr(self, '_loaded_image', None)
+            or not (self.image_hash and self.image_small)
+        )
         super().save(*args, **kwargs)
+        self._loaded_image = self.image.name
 
-        if self.image and not kwargs.get('update_fields'):
-            self._generate_resized_images()
+    @property
+    def has_custom_image(self):
+        return bool(self.image) and (
+            self.image.name not in DEFAULT_PRODUCT_IMAGES
+        )
 
     def _generate_resized_images(self):
-        if self.image.name == 'products/default.jpg':
+        if not self.has_custom_image:
             return
-        original_path = self.image.path
-
-        sizes = {
-            'small': (150, 150),
-            'medium': (300, 300),
-            'large': (800, 800),
-        }
 
-        resized_fields = []
-        for size_name, size in sizes.items():
-            if self._resize_image(original_path, size, size_name):
-                resized_fields.append(f'image_{size_name}')
+        updated_fields = self.apply_image_variants(
+            *ensure_derivatives(self.image.path)
+        )
+        if updated_fields:
+            self.save(update_fields=updated_fields)
+
+    def apply_image_variants(self, digest, variants):
+        """
+        Записывает в продукт хэш оригинала и варианты копий и возвращает
+        список измененных полей.
+
+        Поля image_small/medium/large заполняются JPEG-копиями (или первым
+        доступным форматом) для клиентов, не использующих image_variants.
+        При изменениях в список входит updated_at: частичные сохранения и
+        bulk_update не обновляют его сами.
+        """
+        values = {'image_hash': digest, 'image_variants': variants}
+        for size_name in ('small', 'medium', 'large'):
+            formats = variants.get(size_name, {}).get('formats')
+            if formats:
+                values[f'image_{size_name}'] = formats.get(
+                    'jpeg', next(iter(formats.values()))
+                )
+
+        updated_fields = []
+        for field_name, value in values.items():
+            if getattr(self, field_name) != value:
+                setattr(self, field_name, value)
+                updated_fields.append(field_name)
+        if updated_fields:
+            self.updated_at = timezone.now()
+            updated_fields.append('updated_at')
+        return updated_fields
 
-        if resized_fields:
-            self.save(update_fields=resized_fields)
-
-    def _resize_image(self, original_path, size, size_name):
-        img = Image.open(original_path)
-        img = img.convert('RGB')
-
-        img.thumbnail(size, Image.LANCZOS)
+    def __str__(self):
+        return self.name
 
-        base_name = os.path.basename(os.path.splitext(self.image.name)[0])
-        new_filename = f"{base_name}_{size_name}.jpg"
-        new_path = os.path.join(settings.MEDIA_ROOT,
-                                'products', size_name, new_filename)
 
-        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+class ImageJob(models.Model):
+    """
+    Задача на генерацию уменьшенных изображений продукта.
+
+    Задачи выполняются вне запроса: пулом потоков, синхронно или воркером
+    manage.py process_image_jobs (см. настройку IMAGE_JOBS_MODE).
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
 
-        img.save(new_path, format='JPEG', quality=90)
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Продукт'
+    )
+    status = models.CharField(max_length=MAX_STATUS, choices=STATUS_CHOICES,
+                              default=PENDING, db_index=True,
+                              verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=ZERO,
+                                                verbose_name='Попытки')
+    error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата изменения')
 
-        new_image_field = f'products/{size_name}/{new_filename}'
-        if getattr(self, f'image_{size_name}') != new_image_field:
-            setattr(self, f'image_{size_name}', new_image_field)
-            return True
-        return False
+    class Meta:
+        verbose_name = 'Задача обработки изображений'
+        verbose_name_plural = 'Задачи обработки изображений'
+        ordering = ('created_at',)
 
     def __str__(self):
-        return self.name
+        return f"{self.product} ({self.get_status_display()})"
+
+
+class CartQuerySet(models.QuerySet):
+
+    def with_totals(self):
+        """
+        Добавляет к корзинам общее количество товаров (total_quantity) и
+        общую стоимость (total_price), вычисленные агрегатом в базе.
+        """
+        return self.annotate(
+            total_quantity=Coalesce(Sum('items__quantity'), ZERO),
+            total_price=Coalesce(
+                Sum(
+                    F('items__quantity') * F('items__product__price'),
+                    output_field=models.DecimalField(
+                        max_digits=PRICE_MAX + PRICE_TOTAL_EXTRA_DIGITS,
+                        decimal_places=PRICE_DECIMAL
+                    )
+                ),
+                Value(Decimal(ZERO))
+            )
+        )
 
 
 class Cart(models.Model):
@@ -182,17 +305,117 @@ class Cart(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='shopping_cart',
+        null=True,
+        blank=True,
         verbose_name='Покупатель'
     )
+    guest_key = models.CharField(
+        max_length=MAX_GUEST_KEY,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='Ключ гостевой корзины'
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name='Дата изменения')
+
+    objects = CartQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(user__isnull=False, guest_key__isnull=True)
+                    | models.Q(user__isnull=True, guest_key__isnull=False)
+                ),
+                name='cart_has_single_owner'
+            )
+        ]
 
     def __str__(self):
+        if self.user_id is None:
+            return f"Гостевая корзина {self.guest_key}"
         return f"Корзина пользователя {self.user.username}"
 
 
+class CartItemQuerySet(models.QuerySet):
+
+    def add_quantity(self, cart_id, product_id, quantity):
+        """Атомарно увеличивает количество товара в корзине."""
+        self.add_quantities(cart_id, {product_id: quantity})
+
+    def add_quantities(self, cart_id, quantities):
+        """
+        Атомарно увеличивает количества товаров в корзине или добавляет их.
+
+        quantities — словарь {id продукта: сколько добавить}. На SQLite и
+        PostgreSQL выполняется одним запросом INSERT ... ON CONFLICT DO
+        UPDATE по ограничению unique_cart_item, поэтому параллельные
+        добавления не теряют обновлений. На остальных СУБД для каждого
+        товара используется UPDATE с F() под select_for_update.
+        """
+        if not quantities:
+            return
+        connection = connections[self.db]
+        if connection.vendor in ('sqlite', 'postgresql'):
+            opts = self.model._meta
+            quote = connection.ops.quote_name
+            table = quote(opts.db_table)
+            cart, product, count = (
+                quote(opts.get_field(name).column)
+                for name in ('cart', 'product', 'quantity')
+            )
+            values = ', '.join(['(%s, %s, %s)'] * len(quantities))
+            params = [
+                value
+                for product_id, quantity in quantities.items()
+                for value in (cart_id, product_id, quantity)
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ({cart}, {product}, {count}) '
+                    f'VALUES {values} '
+                    f'ON CONFLICT ({cart}, {product}) DO UPDATE '
+                    f'SET {count} = {table}.{count} + excluded.{count}',
+                    params
+                )
+            return
+
+        with transaction.atomic(using=self.db):
+            for product_id, quantity in quantities.items():
+                items = self.filter(cart_id=cart_id, product_id=product_id)
+                if items.select_for_update().update(
+                    quantity=F('quantity') + quantity
+                ):
+                    continue
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(cart_id=cart_id, product_id=product_id,
+                                    quantity=quantity)
+                except IntegrityError:
+                    items.update(quantity=F('quantity') + quantity)
+
+    def set_quantities(self, cart_id, quantities):
+        """
+        Устанавливает количества товаров в корзине одним запросом,
+        добавляя отсутствующие товары.
+        """
+        if not quantities:
+            return
+        self.bulk_create(
+            [
+                self.model(cart_id=cart_id, product_id=product_id,
+                           quantity=quantity)
+                for product_id, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity']
+        )
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items',
                              on_delete=models.CASCADE)
@@ -201,6 +424,8 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=MIN_QUANTITY,
                                            verbose_name='Количество')
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Товар в корзине'
         verbose_name_plural = 'Товары в корзине'
@@ -0,0 +1,117 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+PRODUCT_TABLE = 'products_product'
+FTS_TABLE = 'products_product_fts'
+SEARCH_INDEX = 'product_name_search_idx'
+SEARCH_CONFIG = 'simple'
+
+
+def _tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def create_search_index(schema_editor):
+    """
+    Создает индекс полнотекстового поиска по названию продукта.
+
+    SQLite: виртуальная таблица FTS5, rowid которой совпадает с id
+    продукта. PostgreSQL: GIN-индекс по to_tsvector(name), который база
+    обновляет сама. Для остальных баз индекс не создается.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            f"name, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name) SELECT id, name '
+            f'FROM {PRODUCT_TABLE}'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON {PRODUCT_TABLE} '
+            f"USING gin (to_tsvector('{SEARCH_CONFIG}', name))"
+        )
+
+
+def drop_search_index(schema_editor):
+    """Удаляет индекс, созданный create_search_index."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+
+
+def index_products(products):
+    """
+    Добавляет или обновляет продукты в таблице FTS5.
+
+    Нужна только для SQLite: в PostgreSQL GIN-индекс по выражению
+    поддерживается самой базой.
+    """
+    if connection.vendor != 'sqlite' or not products:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name) '
+            f'VALUES (%s, %s)',
+            [(product.pk, product.name) for product in products]
+        )
+
+
+def unindex_products(product_ids):
+    """Удаляет продукты из таблицы FTS5."""
+    if connection.vendor != 'sqlite' or not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(product_id,) for product_id in product_ids]
+        )
+
+
+def rebuild_search_index():
+    """Перестраивает таблицу FTS5 после массовых изменений продуктов."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name) SELECT id, name '
+            f'FROM {PRODUCT_TABLE}'
+        )
+
+
+def search_products(queryset, text):
+    """
+    Оставляет в queryset продукты, название которых содержит все слова
+    запроса (слова сопоставляются по префиксу).
+
+    Поиск выполняется по индексу: FTS5 в SQLite, GIN по tsvector в
+    PostgreSQL. На других базах используется icontains по каждому слову.
+    """
+    tokens = _tokens(text)
+    if not tokens:
+        return queryset
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,)
+        ))
+    if connection.vendor == 'postgresql':
+        return queryset.filter(RawSQL(
+            f"to_tsvector('{SEARCH_CONFIG}', {PRODUCT_TABLE}.name) "
+            f"@@ to_tsquery('{SEARCH_CONFIG}', %s)",
+            (' & '.join(f'{token}:*' for token in tokens),),
+            output_field=BooleanField()
+        ))
+    for token in tokens:
+        queryset = queryset.filter(name__icontains=token)
+    return queryset
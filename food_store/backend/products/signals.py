@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Product
+from .search import index_products, rebuild_search_index, unindex_products
+from .tasks import enqueue_image_job
+
+# Отправляется после массовых изменений каталога в обход save()/delete()
+# (bulk_create, bulk_update), sender — измененная модель. Необязательный
+# аргумент fields перечисляет измененные поля, если они известны.
+catalog_changed = Signal()
+
+
+@receiver(post_save, sender=Product)
+def schedule_resized_images(sender, instance, update_fields, **kwargs):
+    """
+    Ставит генерацию уменьшенных изображений в очередь после save().
+
+    Сохранения, не менявшие изображение, не выполняют никакого файлового
+    ввода-вывода.
+    """
+    if update_fields or not instance.has_custom_image:
+        return
+    if not getattr(instance, '_image_changed', True):
+        return
+    enqueue_image_job(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields, **kwargs):
+    """Обновляет название продукта в поисковом индексе."""
+    if update_fields is None or 'name' in update_fields:
+        index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Удаляет продукт из поискового индекса."""
+    unindex_products([instance.pk])
+
+
+@receiver(catalog_changed, sender=Product)
+def rebuild_search_index_after_bulk_change(sender, fields=None, **kwargs):
+    """Перестраивает поисковый индекс после массового изменения названий."""
+    if fields is None or 'name' in fields:
+        rebuild_search_index()
@@ -0,0 +1,141 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import ensure_derivatives
+from .models import ImageJob, Product
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_JOBS_WORKERS,
+                thread_name_prefix='image-jobs'
+            )
+        return _executor
+
+
+def enqueue_image_job(product):
+    """
+    Ставит в очередь генерацию уменьшенных изображений продукта.
+
+    В режиме 'thread' задача отдается пулу потоков после коммита
+    транзакции, в режиме 'sync' выполняется сразу, а в режиме 'queue'
+    остается в базе до запуска manage.py process_image_jobs.
+    """
+    job = ImageJob.objects.create(product=product)
+    mode = settings.IMAGE_JOBS_MODE
+    if mode == 'sync':
+        process_image_job(job.pk)
+    elif mode == 'thread':
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run_in_thread, job.pk)
+        )
+    return job
+
+
+def _claim(job_pk):
+    # QuerySet.update не заполняет auto_now: без updated_at задача, долго
+    # ждавшая в очереди, сразу выглядела бы зависшей для --requeue-after.
+    return ImageJob.objects.filter(
+        pk=job_pk, status=ImageJob.PENDING
+    ).update(status=ImageJob.PROCESSING, attempts=F('attempts') + 1,
+             updated_at=timezone.now()) == 1
+
+
+def prune_image_jobs(before):
+    """Удаляет задачи, выполненные раньше before, и возвращает их число."""
+    deleted, _ = ImageJob.objects.filter(
+        status=ImageJob.DONE, updated_at__lt=before
+    ).delete()
+    return deleted
+
+
+def process_image_job(job_pk):
+    """
+    Выполняет задачу, если ее удалось захватить, и возвращает новый статус.
+
+    Захват выполняется условным UPDATE, поэтому одну задачу не обработают
+    одновременно несколько воркеров. Упавшая задача возвращается в очередь,
+    пока не исчерпан лимит IMAGE_JOBS_MAX_ATTEMPTS.
+    """
+    if not _claim(job_pk):
+        return None
+    job = ImageJob.objects.get(pk=job_pk)
+    try:
+        product = Product.objects.get(pk=job.product_id)
+        product._generate_resized_images()
+    except Exception as error:
+        logger.exception('Image job %s failed', job_pk)
+        job.status = (
+            ImageJob.FAILED
+            if job.attempts >= settings.IMAGE_JOBS_MAX_ATTEMPTS
+            else ImageJob.PENDING
+        )
+        job.error = f'{type(error).__name__}: {error}'
+    else:
+        job.status = ImageJob.DONE
+        job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    return job.status
+
+
+def _run_in_thread(job_pk):
+    close_old_connections()
+    try:
+        attempt = 0
+        while process_image_job(job_pk) == ImageJob.PENDING:
+            attempt += 1
+            time.sleep(settings.IMAGE_JOBS_RETRY_DELAY * attempt)
+    finally:
+        close_old_connections()
+
+
+def render_derivatives(original_path, force=False):
+    """
+    Генерирует копии изображения в процессе пула. С force существующие
+    файлы копий перезаписываются.
+
+    Возвращает (хэш, варианты, None) или (None, None, текст ошибки), чтобы
+    ошибка одного файла не прерывала обработку остальных.
+    """
+    try:
+        return (*ensure_derivatives(original_path, force=force), None)
+    except Exception as error:
+        return None, None, f'{type(error).__name__}: {error}'
+
+
+@contextmanager
+def derivatives_pool(workers=None):
+    """
+    Пул процессов для параллельной генерации копий изображений.
+
+    Соединения с базой закрываются, а все процессы запускаются сразу, до
+    следующего запроса к базе, поэтому дочерние процессы не наследуют
+    сокеты соединений родителя.
+    """
+    connections.close_all()
+    start_methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in start_methods else None
+    )
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             mp_context=context) as pool:
+        pool.submit(os.getpid).result()
+        yield pool
@@ -1,7 +1,10 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from PIL import Image
 from rest_framework.authtoken.models import Token
 
+from api.services import category_tree
 from products.models import Cart, Category, Product, Subcategory
 
 User = get_user_model()
@@ -54,7 +57,35 @@ def product(db, category, subcategory):
     )
 
 
+@pytest.fixture
+def media_root(settings, tmp_path):
+    """Фикстура, перенаправляющая MEDIA_ROOT во временный каталог."""
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def product_image(media_root):
+    """Фикстура для создания оригинального изображения продукта."""
+    path = media_root / 'products' / 'original' / 'photo.jpg'
+    path.parent.mkdir(parents=True)
+    Image.new('RGB', (1200, 900), 'red').save(path, format='JPEG')
+    return 'products/original/photo.jpg'
+
+
 @pytest.fixture
 def cart(db, user):
     """Фикстура для создания корзины."""
     return Cart.objects.create(user=user)
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Сбрасывает кэш дерева категорий, ответов и корзин между тестами."""
+    category_tree.invalidate()
+    for cache in caches.all(initialized_only=True):
+        cache.clear()
+    yield
+    category_tree.invalidate()
+    for cache in caches.all(initialized_only=True):
+        cache.clear()
@@ -0,0 +1,375 @@
+import os
+import shutil
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from products.images import file_digest, get_formats
+from products.models import Category, ImageJob, Product, Subcategory
+from products.tasks import _claim
+
+
+@pytest.mark.django_db
+def test_image_job_processed_by_worker(
+    settings,
+    category,
+    subcategory,
+    product_image
+):
+    """
+    Проверяет, что продукт сохраняется без генерации изображений, а задача
+    из очереди обрабатывается командой process_image_jobs.
+    """
+    settings.IMAGE_JOBS_MODE = 'queue'
+    product = Product.objects.create(
+        name='Photo Product',
+        category=category,
+        subcategory=subcategory,
+        price=10,
+        image=product_image
+    )
+    job = product.image_jobs.get()
+    assert job.status == ImageJob.PENDING
+    assert not product.image_small
+
+    call_command('process_image_jobs', '--once')
+
+    job.refresh_from_db()
+    product.refresh_from_db()
+    assert job.status == ImageJob.DONE
+    assert job.attempts == 1
+    digest = file_digest(product.image.path)
+    assert product.image_hash == digest
+    for size, (width, height) in settings.PRODUCT_IMAGE_SIZES.items():
+        assert getattr(product, f'image_{size}').name == (
+            f'products/{size}/{digest}_{size}_{width}x{height}_q90.jpg'
+        )
+
+
+@pytest.mark.django_db
+def test_image_job_retries_and_fails(
+    settings,
+    media_root,
+    category,
+    subcategory
+):
+    """
+    Проверяет, что задача с ошибкой повторяется до лимита попыток и затем
+    помечается как неуспешная с текстом ошибки.
+    """
+    settings.IMAGE_JOBS_MODE = 'queue'
+    settings.IMAGE_JOBS_MAX_ATTEMPTS = 2
+    product = Product.objects.create(
+        name='Missing Image',
+        category=category,
+        subcategory=subcategory,
+        price=10,
+        image='products/original/missing.jpg'
+    )
+
+    call_command('process_image_jobs', '--once')
+
+    job = product.image_jobs.get()
+    assert job.status == ImageJob.FAILED
+    assert job.attempts == 2
+    assert 'FileNotFoundError' in job.error
+
+
+@pytest.mark.django_db
+def test_image_derivatives_deduplicated(
+    settings,
+    media_root,
+    category,
+    subcategory,
+    product_image
+):
+    """
+    Проверяет, что изменение полей без изображения не ставит задач, а
+    продукты с одинаковыми оригиналами используют общие копии.
+    """
+    settings.IMAGE_JOBS_MODE = 'sync'
+    first = Product.objects.create(
+        name='First',
+        category=category,
+        subcategory=subcategory,
+        price=10,
+        image=product_image
+    )
+    first.refresh_from_db()
+    assert first.image_jobs.count() == 1
+
+    first.price = 20
+    first.name = 'First renamed'
+    first.save()
+    assert first.image_jobs.count() == 1
+
+    copy_name = 'products/original/photo_copy.jpg'
+    shutil.copy(media_root / product_image, media_root / copy_name)
+    small_path = media_root / first.image_small.name
+    modified = small_path.stat().st_mtime_ns
+
+    second = Product.objects.create(
+        name='Second',
+        category=category,
+        subcategory=subcategory,
+        price=10,
+        image=copy_name
+    )
+    second.refresh_from_db()
+    assert second.image_small == first.image_small
+    assert second.image_hash == first.image_hash
+    assert small_path.stat().st_mtime_ns == modified
+    assert len(list((media_root / 'products' / 'small').iterdir())) == (
+        len(get_formats())
+    )
+
+
+@pytest.mark.django_db
+def test_image_variants_in_srcset(
+    client,
+    settings,
+    category,
+    subcategory,
+    product_image
+):
+    """
+    Проверяет, что копии создаются по настройкам размеров и форматов, а
+    API продукта отдает их в виде srcset по форматам.
+    """
+    settings.IMAGE_JOBS_MODE = 'sync'
+    settings.PRODUCT_IMAGE_SIZES = {'thumb': (100, 100), 'card': (400, 400)}
+    settings.PRODUCT_IMAGE_FORMATS = {'webp': 75, 'jpeg': 85}
+    product = Product.objects.create(
+        name='Variants',
+        category=category,
+        subcategory=subcategory,
+        price=10,
+        image=product_image
+    )
+    product.refresh_from_db()
+    assert product.image_variants['card']['width'] == 400
+    assert product.image_variants['thumb']['height'] == 75
+
+    url = reverse('api:product-detail', kwargs={'pk': product.pk})
+    srcset = client.get(url).json()['srcset']
+    assert list(srcset) == ['webp', 'jpeg']
+    assert srcset['webp'] == (
+        f'http://testserver/media/products/thumb/{product.image_hash}'
+        f'_thumb_100x100_q75.webp 100w, http://testserver/media/products/'
+        f'card/{product.image_hash}_card_400x400_q75.webp 400w'
+    )
+
+
+@pytest.mark.django_db
+def test_backfill_image_variants(
+    settings,
+    category,
+    subcategory,
+    product_image
+):
+    """
+    Проверяет, что команда backfill_image_variants параллельно создает
+    варианты для продуктов без копий, пропускает уже обработанные,
+    перестраивает копии после изменения размеров, а с --force
+    перезаписывает существующие файлы.
+    """
+    settings.IMAGE_JOBS_MODE = 'queue'
+    products = [
+        Product.objects.create(
+            name=f'Backfill {index}',
+            category=category,
+            subcategory=subcategory,
+            price=10,
+            image=product_image
+        )
+        for index in range(3)
+    ]
+
+    call_command('backfill_image_variants', '--workers', '2', '--batch', '2')
+
+    for product in products:
+        product.refresh_from_db()
+        assert set(product.image_variants) == set(settings.PRODUCT_IMAGE_SIZES)
+        assert product.image_small.name.endswith('_small_150x150_q90.jpg')
+
+    output = StringIO()
+    call_command('backfill_image_variants', stdout=output)
+    assert 'обновлено 0' in output.getvalue()
+
+    settings.PRODUCT_IMAGE_SIZES = {**settings.PRODUCT_IMAGE_SIZES,
+                                    'small': (200, 200)}
+    call_command('backfill_image_variants', '--workers', '1',
+                 stdout=StringIO())
+    product = products[0]
+    product.refresh_from_db()
+    assert product.image_small.name.endswith('_small_200x200_q90.jpg')
+    with Image.open(product.image_small.path) as img:
+        assert max(img.size) == 200
+
+    small_path = Path(product.image_small.path)
+    os.utime(small_path, ns=(0, 0))
+    call_command('backfill_image_variants', '--workers', '1', '--force',
+                 stdout=StringIO())
+    assert small_path.stat().st_mtime_ns > 0
+
+
+@pytest.mark.django_db
+def test_import_catalog(tmp_path, product_image):
+    """
+    Проверяет импорт каталога: создание категорий, подкатегорий и
+    продуктов пакетами, обновление по слагу при повторном импорте,
+    пропуск некорректных строк и генерацию копий изображений.
+    """
+    source = tmp_path / 'catalog.csv'
+    source.write_text(
+        'category,category_slug,subcategory,name,price,image\n'
+        f'Meat,meat,Beef,Steak,10.50,{product_image}\n'
+        'Meat,meat,Pork,Ham,5,\n'
+        'Dairy,dairy,Milk,Kefir,2.30,\n'
+        'Dairy,dairy,Milk,Broken,-1,\n',
+        encoding='utf-8'
+    )
+
+    output = StringIO()
+    call_command('import_catalog', str(source), '--batch-size', '2',
+                 '--workers', '2', stdout=output, stderr=StringIO())
+
+    assert Category.objects.count() == 2
+    assert Subcategory.objects.count() == 3
+    assert Product.objects.count() == 3
+    steak = Product.objects.get(slug='steak')
+    assert steak.subcategory.category.slug == 'meat'
+    assert steak.image_small.name == (
+        f'products/small/{steak.image_hash}_small_150x150_q90.jpg'
+    )
+    assert 'ошибок: 1' in output.getvalue()
+
+    updated = tmp_path / 'catalog.jsonl'
+    updated.write_text(
+        '{"category": "Meat", "category_slug": "meat", '
+        '"subcategory": "Beef", "name": "Steak", "price": "12"}\n',
+        encoding='utf-8'
+    )
+    call_command('import_catalog', str(updated), '--workers', '0',
+                 stdout=StringIO())
+
+    image, image_hash = steak.image.name, steak.image_hash
+    steak.refresh_from_db()
+    assert Product.objects.count() == 3
+    assert steak.price == 12
+    assert steak.image.name == image
+    assert steak.image_hash == image_hash
+
+    replaced = tmp_path / 'replaced.jsonl'
+    replaced.write_text(
+        '{"category": "Meat", "category_slug": "meat", '
+        '"subcategory": "Beef", "name": "Steak", "price": "12", '
+        '"image": "products/other.jpg"}\n',
+        encoding='utf-8'
+    )
+    call_command('import_catalog', str(replaced), '--workers', '0',
+                 stdout=StringIO())
+    steak.refresh_from_db()
+    assert steak.image.name == 'products/other.jpg'
+    assert steak.image_hash == ''
+    assert steak.image_variants == {}
+    assert not steak.image_small
+
+
+@pytest.mark.django_db
+def test_import_catalog_cyrillic_slugs_and_name_conflicts(tmp_path):
+    """
+    Проверяет, что слаги строятся из кириллических названий, а строки с
+    категорией, название которой занято другим слагом, пропускаются с
+    сообщением, не прерывая импорт.
+    """
+    Category.objects.create(name='Молочное', slug='dairy',
+                            image='categories/category_default.jpg')
+    source = tmp_path / 'catalog.csv'
+    source.write_text(
+        'category,category_slug,subcategory,name,price\n'
+        'Мясо,,Говядина,Стейк,10\n'
+        'Молочное,,Молоко,Кефир,2\n'
+        'Молочное,,Молоко,Ряженка,3\n',
+        encoding='utf-8'
+    )
+    output, errors = StringIO(), StringIO()
+    call_command('import_catalog', str(source), '--workers', '0',
+                 stdout=output, stderr=errors)
+
+    steak = Product.objects.get(slug='стейк')
+    assert steak.category.slug == 'мясо'
+    assert steak.subcategory.slug == 'говядина'
+    assert not Product.objects.filter(name__in=['Кефир', 'Ряженка']).exists()
+    assert 'Строка 3' in errors.getvalue()
+    assert 'Строка 4' in errors.getvalue()
+    assert 'ошибок: 2' in output.getvalue()
+
+
+@pytest.mark.django_db
+def test_import_catalog_rejects_bad_rows(tmp_path):
+    """
+    Проверяет, что некорректный JSON, строка не-объект и подкатегория из
+    чужой категории пропускаются с сообщением, не мешая остальным строкам
+    пакета, а длинные названия дают слаг не длиннее поля.
+    """
+    long_name = 'Очень длинное название ' * 6
+    source = tmp_path / 'catalog.jsonl'
+    source.write_text(
+        '{"category": "A", "subcategory": "Milk", "name": "x", "price": 1}\n'
+        '{"category": "B", "subcategory": "Milk", "name": "y", "price": 1}\n'
+        '{"category": "A", "subcategory"\n'
+        '["a"]\n'
+        f'{{"category": "A", "subcategory": "Milk", "name": "{long_name}", '
+        '"price": 2}\n',
+        encoding='utf-8'
+    )
+    output, errors = StringIO(), StringIO()
+    call_command('import_catalog', str(source), '--workers', '0',
+                 stdout=output, stderr=errors)
+
+    assert Product.objects.get(slug='x').subcategory.category.slug == 'a'
+    assert not Product.objects.filter(slug='y').exists()
+    product = Product.objects.get(name=long_name.strip())
+    assert len(product.slug) <= 100
+    assert not product.slug.endswith('-')
+    for line in (2, 3, 4):
+        assert f'Строка {line}:' in errors.getvalue()
+    assert 'ошибок: 3' in output.getvalue()
+
+
+@pytest.mark.django_db
+def test_image_job_claim_and_pruning(settings, category, subcategory,
+                                     product_image):
+    """
+    Проверяет, что захват задачи обновляет updated_at (долго ждавшая
+    задача не возвращается в очередь как зависшая), а выполненные задачи
+    старше IMAGE_JOBS_KEEP_DONE удаляются.
+    """
+    settings.IMAGE_JOBS_MODE = 'queue'
+    product = Product.objects.create(
+        name='Photo Product', category=category, subcategory=subcategory,
+        price=10, image=product_image
+    )
+    job = product.image_jobs.get()
+    long_ago = timezone.now() - timedelta(hours=1)
+    ImageJob.objects.filter(pk=job.pk).update(updated_at=long_ago)
+
+    assert _claim(job.pk)
+    call_command('process_image_jobs', '--once', '--requeue-after', '60',
+                 stdout=StringIO())
+    job.refresh_from_db()
+    assert job.status == ImageJob.PROCESSING
+    assert job.attempts == 1
+
+    ImageJob.objects.filter(pk=job.pk).update(status=ImageJob.DONE,
+                                              updated_at=long_ago)
+    recent = ImageJob.objects.create(product=product, status=ImageJob.DONE)
+    call_command('purge_image_jobs', '--max-age', '60', stdout=StringIO())
+    assert list(ImageJob.objects.values_list('pk', flat=True)) == [recent.pk]
@@ -0,0 +1,125 @@
+import json
+import re
+import threading
+
+import pytest
+from django.urls import reverse
+
+from api.metrics import RouteStats, registry
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    registry.reset()
+    yield
+    registry.reset()
+
+
+def metric(text, name, **labels):
+    """Возвращает значение метрики с указанными метками из ответа."""
+    for line in text.splitlines():
+        match = re.fullmatch(r'(\w+)\{(.*)\} (\S+)', line)
+        if match is None or match[1] != f'food_store_{name}':
+            continue
+        line_labels = dict(re.findall(r'(\w+)="([^"]*)"', match[2]))
+        if all(line_labels.get(key) == str(value)
+               for key, value in labels.items()):
+            return float(match[3])
+    return None
+
+
+@pytest.mark.django_db
+def test_metrics_per_route(client, product):
+    """
+    Проверяет, что /metrics отдает по маршрутам число запросов со
+    статусами, гистограммы времени и размера ответа, число и время
+    SQL-запросов, время рендеринга и обращения к кэшу ответов каталога.
+    """
+    for _ in range(3):
+        client.get(reverse('api:product-list'), {'page_size': 1})
+    client.get(reverse('api:product-detail', kwargs={'pk': 'missing'}))
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.content.decode()
+
+    route = {'route': 'api:product-list', 'method': 'GET'}
+    assert metric(text, 'http_requests_total', status=200, **route) == 3
+    assert metric(text, 'http_requests_total', route='api:product-detail',
+                  status=404) == 1
+    assert metric(text, 'http_request_duration_seconds_bucket', le='+Inf',
+                  **route) == 3
+    assert metric(text, 'http_request_duration_seconds_sum', **route) > 0
+    assert metric(text, 'http_response_size_bytes_sum', **route) > 0
+    assert metric(text, 'db_queries_total', **route) > 0
+    assert metric(text, 'db_query_duration_seconds_total', **route) > 0
+    assert metric(text, 'serialization_duration_seconds_total',
+                  **route) > 0
+    assert metric(text, 'catalog_cache_requests_total', outcome='miss',
+                  **route) == 1
+    assert metric(text, 'catalog_cache_requests_total', outcome='hit',
+                  **route) == 2
+    assert '# TYPE food_store_http_request_duration_seconds histogram' in text
+
+
+@pytest.mark.django_db
+def test_metrics_merge_worker_files(client, settings, tmp_path, product):
+    """
+    Проверяет, что при METRICS_MULTIPROC_DIR процесс сохраняет свои
+    показатели в файл, а /metrics суммирует файлы других процессов.
+    """
+    settings.METRICS_MULTIPROC_DIR = str(tmp_path)
+    settings.METRICS_DUMP_INTERVAL = 0
+    other = RouteStats()
+    other.statuses = {'200': 5}
+    other.latency[0] = 5
+    other.queries = 10
+    (tmp_path / '1.json').write_text(json.dumps(
+        [['api:product-list', 'GET', other.to_dict()]]
+    ))
+
+    client.get(reverse('api:product-list'))
+
+    own_files = [path for path in tmp_path.iterdir() if path.name != '1.json']
+    assert len(own_files) == 1
+    text = client.get('/metrics').content.decode()
+    assert metric(text, 'http_requests_total', route='api:product-list',
+                  status=200) == 6
+    assert metric(text, 'http_request_duration_seconds_bucket',
+                  route='api:product-list', le='0.005') >= 5
+
+
+@pytest.mark.django_db
+def test_metrics_access(client, settings):
+    """
+    Проверяет, что /metrics доступен только с разрешенных адресов или с
+    токеном METRICS_TOKEN.
+    """
+    settings.METRICS_TOKEN = 'secret'
+    assert client.get('/metrics').status_code == 200
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    assert client.get('/metrics', **remote).status_code == 403
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong',
+                      **remote).status_code == 403
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret',
+                      **remote).status_code == 200
+
+
+def test_finished_threads_folded():
+    """
+    Проверяет, что показатели завершившихся потоков суммируются в общий
+    словарь, а не хранятся по словарю на поток.
+    """
+    def request():
+        registry.record('route', 'GET', 200, 0.001, 10, 1, 0.0, 0.0)
+
+    for _ in range(5):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    request()
+
+    assert len(registry._threads) <= 2
+    assert registry.snapshot()[('route', 'GET')].count == 6
+    assert len(registry._threads) == 1
@@ -0,0 +1,102 @@
+import json
+import pstats
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+@pytest.fixture
+def profile_dir(settings, tmp_path):
+    settings.PROFILE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def staff_client(db):
+    """Клиент сотрудника, авторизованный токеном."""
+    user = get_user_model().objects.create_user(
+        username='staff', password='password', is_staff=True
+    )
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key
+    )
+    return client
+
+
+@pytest.mark.django_db
+def test_profile_pstats_with_sql_log(staff_client, profile_dir, product):
+    """
+    Проверяет, что по заголовку X-Profile запрос сотрудника профилируется
+    cProfile в обход кэша ответов, а журнал SQL содержит время и место
+    вызова запросов.
+    """
+    staff_client.get(reverse('api:product-list'))
+    response = staff_client.get(reverse('api:product-list'),
+                                HTTP_X_PROFILE='pstats')
+    assert response.status_code == 200
+    assert response['X-Cache'] == 'BYPASS'
+    assert response.json()['results'][0]['id'] == product.id
+
+    download = staff_client.get(response['X-Profile-Download'])
+    assert download.status_code == 200
+    profile_path = profile_dir / f'{response["X-Profile-Id"]}.prof'
+    assert pstats.Stats(str(profile_path)).total_calls > 0
+
+    sql_log = json.loads(
+        b''.join(staff_client.get(response['X-Profile-SQL']).streaming_content)
+    )
+    assert sql_log['status'] == 200
+    assert sql_log['queries']
+    query = sql_log['queries'][0]
+    assert 'products_product' in ''.join(
+        entry['sql'] for entry in sql_log['queries']
+    )
+    assert query['duration_ms'] >= 0
+    assert any(frame.startswith('api/') for entry in sql_log['queries']
+               for frame in entry['stack'])
+
+
+@pytest.mark.django_db
+def test_profile_speedscope(staff_client, profile_dir, settings, product):
+    """Проверяет профиль выборкой в формате speedscope по параметру."""
+    settings.PROFILE_SAMPLE_INTERVAL = 0.0001
+    response = staff_client.get(reverse('api:product-list'),
+                                {'_profile': 'speedscope'})
+    assert response.status_code == 200
+
+    path = profile_dir / f'{response["X-Profile-Id"]}.speedscope.json'
+    profile = json.loads(path.read_text())
+    sampled = profile['profiles'][0]
+    assert sampled['type'] == 'sampled'
+    assert len(sampled['samples']) == len(sampled['weights'])
+    frame_count = len(profile['shared']['frames'])
+    assert all(0 <= index < frame_count
+               for sample in sampled['samples'] for index in sample)
+
+
+@pytest.mark.django_db
+def test_profile_requires_staff(client, auth_token, staff_client,
+                                profile_dir, product):
+    """
+    Проверяет, что флаг игнорируется для анонимов и обычных
+    пользователей, а скачать профиль может только сотрудник.
+    """
+    user_client = APIClient()
+    user_client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
+    for api_client in (client, user_client):
+        response = api_client.get(reverse('api:product-list'),
+                                  HTTP_X_PROFILE='pstats')
+        assert response.status_code == 200
+        assert 'X-Profile-Id' not in response
+    assert not any(profile_dir.iterdir())
+
+    url = staff_client.get(reverse('api:product-list'),
+                           HTTP_X_PROFILE='1')['X-Profile-Download']
+    assert client.get(url).status_code == 401
+    assert staff_client.get(
+        reverse('profile-download', kwargs={'name': '..%2Fsecret.prof'})
+    ).status_code == 404
@@ -1,9 +1,24 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
 import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from products.models import CartItem
+from api.cache import bump_version, get_cache_stats, get_last_modified
+from api.cart_storage import CacheCartStorage
+from api.checks import check_cart_cache
+from api.services import category_tree
+from products.models import Cart, CartItem, Category, Product, Subcategory
+from products.signals import catalog_changed
 
 
 @pytest.mark.parametrize(
@@ -49,12 +64,16 @@ def test_pages_availability_for_users(
 def test_cart_list_access(client, user, auth_token):
     """
     Тестирует доступ к списку корзины. Проверяет, что неавторизованный
-    пользователь получает статус 401, а авторизованный — статус 200.
+    пользователь получает пустую гостевую корзину без создания сессии,
+    а авторизованный — свою корзину.
     """
     url = reverse('api:cart-list')
 
     response = client.get(url)
-    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['items'] == []
+    assert response.data['total_quantity'] == 0
+    assert settings.SESSION_COOKIE_NAME not in response.cookies
 
     response = client.get(url, HTTP_AUTHORIZATION='Token ' + auth_token)
     assert response.status_code == status.HTTP_200_OK
@@ -63,9 +82,9 @@ def test_cart_list_access(client, user, auth_token):
 @pytest.mark.django_db
 def test_add_product_to_cart(user, auth_token, product, cart):
     """
-    Тестирует добавление товара в корзину. Проверяет, что неавторизованные
-    пользователи не могут добавлять товары, в то время как авторизованные могут
-    добавлять товары в корзину.
+    Тестирует добавление товара в корзину. Проверяет, что неавторизованный
+    пользователь добавляет товар в гостевую корзину, а авторизованный — в
+    свою корзину.
     Также проверяется, что количество товаров в корзине обновляется корректно
     при добавлении одного и того же товара несколько раз.
     """
@@ -79,7 +98,11 @@ def test_add_product_to_cart(user, auth_token, product, cart):
     }
 
     response = client.post(url, data)
-    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.status_code == status.HTTP_201_CREATED
+    assert CartItem.objects.get(
+        cart__guest_key__isnull=False, product=product
+    ).quantity == 1
+    client.cookies.clear()
 
     client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
 
@@ -95,3 +118,847 @@ def test_add_product_to_cart(user, auth_token, product, cart):
     assert response.status_code == status.HTTP_201_CREATED
     cart_item.refresh_from_db()
     assert cart_item.quantity == 3
+
+
+@pytest.mark.parametrize('products_count', [1, 5, 12])
+@pytest.mark.django_db
+def test_product_list_query_count(
+    client,
+    category,
+    subcategory,
+    products_count,
+    django_assert_num_queries
+):
+    """
+    Проверяет, что список продуктов выполняет фиксированное число запросов
+    (версии таблиц, COUNT для пагинации и одна выборка с JOIN категорий)
+    независимо от количества продуктов на странице.
+    """
+    Product.objects.bulk_create(
+        Product(
+            name=f'Product {index}',
+            slug=f'product-{index}',
+            category=category,
+            subcategory=subcategory,
+            price=10,
+            image='products/default.jpg'
+        )
+        for index in range(products_count)
+    )
+    get_last_modified((Product, Category, Subcategory))
+
+    with django_assert_num_queries(3):
+        response = client.get(reverse('api:product-list'))
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['results'][0]['category']['slug'] == category.slug
+
+
+@pytest.mark.parametrize('lookup', ['pk', 'slug'])
+@pytest.mark.django_db
+def test_product_detail_query_count(
+    client,
+    product,
+    lookup,
+    django_assert_num_queries
+):
+    """
+    Проверяет, что карточка продукта по id или по слагу отдается одним
+    запросом (и запросом версий таблиц).
+    """
+    url = reverse('api:product-detail',
+                  kwargs={'pk': getattr(product, lookup)})
+    get_last_modified((Product, Category, Subcategory))
+
+    with django_assert_num_queries(2):
+        response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['id'] == product.pk
+    assert response.json()['subcategory']['slug'] == product.subcategory.slug
+
+
+@pytest.mark.django_db
+def test_category_list_served_from_tree(
+    client,
+    category,
+    subcategory,
+    django_assert_num_queries,
+    django_capture_on_commit_callbacks
+):
+    """
+    Проверяет, что дерево категорий строится двумя запросами, повторные
+    запросы отдаются из кэша (остается запрос версий таблиц), а изменение
+    подкатегории сбрасывает кэш после коммита транзакции.
+    """
+    url = reverse('api:category-list')
+    get_last_modified((Category, Subcategory))
+
+    with django_assert_num_queries(3):
+        client.get(url)
+    with django_assert_num_queries(1):
+        response = client.get(url)
+    assert response.json()['results'][0]['subcategories'][0]['name'] == (
+        subcategory.name
+    )
+
+    subcategory.name = 'Renamed Subcategory'
+    with django_capture_on_commit_callbacks(execute=True):
+        subcategory.save()
+        tree = category_tree.get_categories()
+        assert tree[0].subcategories.all()[0].name == 'Test Subcategory'
+
+    with django_assert_num_queries(3):
+        response = client.get(url)
+    assert response.json()['results'][0]['subcategories'][0]['name'] == (
+        'Renamed Subcategory'
+    )
+
+    detail_url = reverse('api:category-detail', kwargs={'pk': category.pk})
+    with django_assert_num_queries(1):
+        response = client.get(detail_url)
+    assert response.status_code == status.HTTP_200_OK
+
+    missing_url = reverse('api:category-detail', kwargs={'pk': 0})
+    assert client.get(missing_url).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize('shared', [False, True])
+@pytest.mark.django_db
+def test_category_tree_follows_other_processes(client, settings, category,
+                                               shared):
+    """
+    Проверяет, что дерево категорий перестраивается по версии таблиц,
+    когда изменение сделано другим процессом и локальный сигнал не
+    сбросил дерево.
+    """
+    settings.CATALOG_CACHE_SHARED = shared
+    assert client.get(reverse('api:category-list')).json()['count'] == 1
+
+    Category.objects.bulk_create([Category(
+        name='Other', slug='other', image='categories/category_default.jpg'
+    )])
+    bump_version(Category)
+
+    assert client.get(reverse('api:category-list')).json()['count'] == 2
+    response = client.get(
+        reverse('api:category-detail', kwargs={'pk': 'other'})
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = client.get(reverse('api:product-list'), {'category': 'other'})
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.parametrize('shared', [False, True])
+@pytest.mark.django_db
+def test_catalog_response_cache(client, settings, category, product, shared,
+                                django_capture_on_commit_callbacks):
+    """
+    Проверяет кэширование ответов каталога с версиями таблиц в базе и в
+    общем кэше: повторный запрос отдается из кэша, а изменение цены
+    продукта после коммита сбрасывает только ответы по продуктам.
+    """
+    settings.CATALOG_CACHE_SHARED = shared
+    product_url = reverse('api:product-list')
+    category_url = reverse('api:category-list')
+
+    assert client.get(product_url)['X-Cache'] == 'MISS'
+    assert client.get(category_url)['X-Cache'] == 'MISS'
+    assert client.get(product_url)['X-Cache'] == 'HIT'
+    assert client.get(f'{product_url}?page=1')['X-Cache'] == 'MISS'
+
+    product.price = 250
+    with django_capture_on_commit_callbacks(execute=True):
+        product.save()
+        assert client.get(product_url)['X-Cache'] == 'HIT'
+
+    response = client.get(product_url)
+    assert response['X-Cache'] == 'MISS'
+    assert response.json()['results'][0]['price'] == '250.00'
+    assert client.get(category_url)['X-Cache'] == 'HIT'
+    assert get_cache_stats() == {'hit': 3, 'miss': 4}
+
+
+@pytest.mark.parametrize('shared', [False, True])
+@pytest.mark.parametrize('name', ['api:category-list', 'api:product-list'])
+@pytest.mark.django_db
+def test_catalog_conditional_get(client, settings, name, product, shared,
+                                 django_capture_on_commit_callbacks):
+    """
+    Проверяет, что каталог отдает ETag и Last-Modified, отвечает 304 на
+    совпадающие валидаторы и меняет ETag после изменения данных.
+    """
+    settings.CATALOG_CACHE_SHARED = shared
+    url = reverse(name)
+    response = client.get(url)
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response['ETag'] == etag
+
+    response = client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.subcategory.save()
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_catalog_versions_follow_partial_writes(
+    client,
+    settings,
+    category,
+    subcategory,
+    product_image,
+    django_capture_on_commit_callbacks
+):
+    """
+    Проверяет, что без общего кэша версии таблиц из CatalogVersion
+    меняются после записи копий изображений (частичное сохранение) и
+    удаления: ответ не берется из кэша, а старый ETag не дает 304.
+    """
+    settings.CATALOG_CACHE_SHARED = False
+    settings.IMAGE_JOBS_MODE = 'queue'
+    with django_capture_on_commit_callbacks(execute=True):
+        product = Product.objects.create(
+            name='Photo Product', category=category, subcategory=subcategory,
+            price=10, image=product_image
+        )
+    url = reverse('api:product-detail', kwargs={'pk': product.pk})
+    response = client.get(url)
+    etag = response['ETag']
+    assert response.json()['image_small'] is None
+    assert 'Last-Modified' in response
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == (
+        status.HTTP_304_NOT_MODIFIED
+    )
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command('process_image_jobs', '--once')
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['X-Cache'] == 'MISS'
+    assert response.json()['image_small'].endswith('.jpg')
+
+    list_url = reverse('api:product-list')
+    etag = client.get(list_url)['ETag']
+    with django_capture_on_commit_callbacks(execute=True):
+        product.delete()
+    response = client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_product_cursor_pagination(
+    client,
+    category,
+    subcategory,
+    settings,
+    django_assert_num_queries
+):
+    """
+    Проверяет keyset-пагинацию продуктов: обход по ссылкам next возвращает
+    все продукты по порядку, страница выбирается без COUNT одним запросом
+    (и запросом версий таблиц), а размер страницы ограничен настройкой
+    CATALOG_MAX_PAGE_SIZE.
+    """
+    settings.CATALOG_MAX_PAGE_SIZE = 4
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Product {index}',
+            slug=f'product-{index}',
+            category=category,
+            subcategory=subcategory,
+            price=10,
+            image='products/default.jpg'
+        )
+        for index in range(10)
+    )
+    get_last_modified((Product, Category, Subcategory))
+
+    url = reverse('api:product-list') + '?pagination=cursor&page_size=50'
+    seen = []
+    while url:
+        with django_assert_num_queries(2):
+            data = client.get(url).json()
+        assert 'count' not in data
+        assert len(data['results']) <= settings.CATALOG_MAX_PAGE_SIZE
+        seen += [item['id'] for item in data['results']]
+        url = data['next']
+
+    assert seen == [product.pk for product in products]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_add_to_cart(product, cart):
+    """
+    Проверяет, что параллельные добавления одного товара в корзину не
+    теряют обновлений и итоговое количество точно равно сумме.
+    """
+    threads_count, adds_per_thread = 8, 10
+    barrier = threading.Barrier(threads_count)
+    errors = []
+
+    def add_many():
+        try:
+            barrier.wait()
+            for _ in range(adds_per_thread):
+                CartItem.objects.add_quantity(cart.pk, product.pk, 1)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=add_many) for _ in range(threads_count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert CartItem.objects.get(cart=cart, product=product).quantity == (
+        threads_count * adds_per_thread
+    )
+
+
+@pytest.mark.django_db
+def test_cart_batch(user, auth_token, category, subcategory, product, cart):
+    """
+    Проверяет пакетное изменение корзины: операции применяются по порядку,
+    а несуществующие продукты или неполные операции отклоняют весь пакет.
+    """
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Batch {index}',
+            slug=f'batch-{index}',
+            category=category,
+            subcategory=subcategory,
+            price=10,
+            image='products/default.jpg'
+        )
+        for index in range(3)
+    )
+    CartItem.objects.create(cart=cart, product=product, quantity=5)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
+    url = reverse('api:cart-batch')
+
+    response = client.post(url, {'operations': [
+        {'op': 'add', 'product_id': products[0].pk, 'quantity': 2},
+        {'op': 'add', 'product_id': products[0].pk, 'quantity': 3},
+        {'op': 'set', 'product_id': products[1].pk, 'quantity': 7},
+        {'op': 'add', 'product_id': products[1].pk, 'quantity': 1},
+        {'op': 'add', 'product_id': products[2].pk, 'quantity': 1},
+        {'op': 'remove', 'product_id': products[2].pk},
+        {'op': 'remove', 'product_id': product.pk},
+    ]}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert {
+        item['product']['id']: item['quantity']
+        for item in response.data['items']
+    } == {products[0].pk: 5, products[1].pk: 8}
+
+    response = client.post(url, {'operations': [
+        {'op': 'add', 'product_id': products[0].pk, 'quantity': 1},
+        {'op': 'add', 'product_id': 0, 'quantity': 1},
+    ]}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert CartItem.objects.get(product=products[0]).quantity == 5
+
+    response = client.post(url, {'operations': [
+        {'op': 'set', 'product_id': products[0].pk},
+    ]}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('items_count', [1, 10])
+@pytest.mark.django_db
+def test_cart_list_totals(
+    client,
+    auth_token,
+    category,
+    subcategory,
+    cart,
+    items_count,
+    django_assert_num_queries
+):
+    """
+    Проверяет, что итоги корзины считаются в базе, а число запросов не
+    зависит от количества товаров (токен, корзина с итогами, товары).
+    """
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Cart {index}',
+            slug=f'cart-{index}',
+            category=category,
+            subcategory=subcategory,
+            price='10.25',
+            image='products/default.jpg'
+        )
+        for index in range(items_count)
+    )
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=product, quantity=index + 1)
+        for index, product in enumerate(products)
+    )
+    url = reverse('api:cart-list')
+
+    with django_assert_num_queries(3):
+        response = client.get(url, HTTP_AUTHORIZATION='Token ' + auth_token)
+    assert response.status_code == status.HTTP_200_OK
+    total_quantity = items_count * (items_count + 1) // 2
+    assert response.data['total_quantity'] == total_quantity
+    assert response.data['total_price'] == Decimal('10.25') * total_quantity
+
+
+@pytest.mark.django_db
+def test_cart_compact_view(client, auth_token, product, cart):
+    """
+    Проверяет компактное представление корзины: у товара выводятся только
+    id, название, цена, маленькое изображение продукта и количество.
+    """
+    CartItem.objects.create(cart=cart, product=product, quantity=2)
+    url = reverse('api:cart-list') + '?view=compact'
+
+    response = client.get(url, HTTP_AUTHORIZATION='Token ' + auth_token)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['items'] == [{
+        'product_id': product.pk,
+        'name': product.name,
+        'price': '100.00',
+        'image_small': None,
+        'quantity': 2,
+    }]
+    assert response.data['total_quantity'] == 2
+
+
+@pytest.mark.django_db
+def test_cache_cart_storage(
+    settings,
+    user,
+    auth_token,
+    product,
+    django_assert_num_queries
+):
+    """
+    Проверяет хранилище корзин в кэше: изменения не пишутся в базу до
+    flush_carts, корзина отдается из кэша, а после flush_carts
+    содержимое корзины сохраняется в Cart/CartItem.
+    """
+    settings.CART_STORAGE = 'api.cart_storage.CacheCartStorage'
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
+
+    response = client.post(reverse('api:cart-add'),
+                           {'product_id': product.pk, 'quantity': 2})
+    assert response.status_code == status.HTTP_201_CREATED
+    with django_assert_num_queries(2):
+        response = client.post(reverse('api:cart-add'),
+                               {'product_id': product.pk, 'quantity': 3})
+    assert not CartItem.objects.exists()
+
+    response = client.get(reverse('api:cart-list'))
+    assert response.data['total_quantity'] == 5
+    assert response.data['items'][0]['product']['id'] == product.pk
+
+    call_command('flush_carts', stdout=StringIO())
+    assert CartItem.objects.get(cart__user=user).quantity == 5
+
+    response = client.delete(reverse('api:cart-remove'),
+                             {'product_id': product.pk})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert CartItem.objects.exists()
+    call_command('flush_carts', stdout=StringIO())
+    assert not CartItem.objects.exists()
+
+
+@pytest.mark.django_db
+def test_cache_cart_flush_skips_deleted_products(settings, user, product,
+                                                 category, subcategory):
+    """
+    Проверяет, что flush_carts отбрасывает удаленные из каталога товары,
+    сохраняет остальные корзины при ошибке одной из них и повторяет ее
+    при следующем запуске.
+    """
+    settings.CART_STORAGE = 'api.cart_storage.CacheCartStorage'
+    deleted = Product.objects.create(
+        name='Deleted', slug='deleted', category=category,
+        subcategory=subcategory, price=5, image='products/default.jpg'
+    )
+    CacheCartStorage(user=user).add({product.pk: 1, deleted.pk: 2})
+    CacheCartStorage(guest_key='guest').add({product.pk: 3})
+    deleted.delete()
+
+    busy = CacheCartStorage(guest_key='busy')
+    busy.add({product.pk: 4})
+    busy.cache.set(busy.lock_key, 'other', timeout=None)
+    CacheCartStorage.LOCK_TIMEOUT, timeout = 0, CacheCartStorage.LOCK_TIMEOUT
+    try:
+        assert CacheCartStorage.flush_all() == 2
+    finally:
+        CacheCartStorage.LOCK_TIMEOUT = timeout
+    assert dict(CartItem.objects.filter(cart__user=user).values_list(
+        'product_id', 'quantity'
+    )) == {product.pk: 1}
+    assert CartItem.objects.get(cart__guest_key='guest').quantity == 3
+    assert not Cart.objects.filter(guest_key='busy').exists()
+
+    busy.cache.delete(busy.lock_key)
+    assert CacheCartStorage.flush_all() == 1
+    assert CartItem.objects.get(cart__guest_key='busy').quantity == 4
+    assert CacheCartStorage.flush_all() == 0
+
+
+@pytest.mark.django_db
+def test_cache_cart_lock_timeout(settings, auth_token, user, product):
+    """
+    Проверяет, что занятая корзина не изменяется без блокировки: запрос
+    получает 503, а чужая блокировка не снимается.
+    """
+    settings.CART_STORAGE = 'api.cart_storage.CacheCartStorage'
+    storage = CacheCartStorage(user=user)
+    storage.cache.set(storage.lock_key, 'other', timeout=None)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
+    CacheCartStorage.LOCK_TIMEOUT, timeout = 0, CacheCartStorage.LOCK_TIMEOUT
+    try:
+        response = client.post(reverse('api:cart-add'),
+                               {'product_id': product.pk, 'quantity': 1})
+    finally:
+        CacheCartStorage.LOCK_TIMEOUT = timeout
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert storage.cache.get(storage.lock_key) == 'other'
+    assert storage.cache.get(storage.items_key) is None
+
+
+def test_cart_cache_check(settings):
+    """Проверяет, что CacheCartStorage с locmem-кэшем не проходит проверку."""
+    settings.CART_STORAGE = 'api.cart_storage.CacheCartStorage'
+    assert [error.id for error in check_cart_cache(None)] == ['api.E001']
+    settings.CART_STORAGE = 'api.cart_storage.DatabaseCartStorage'
+    assert check_cart_cache(None) == []
+
+
+@pytest.mark.parametrize('storage', [
+    'api.cart_storage.DatabaseCartStorage',
+    'api.cart_storage.CacheCartStorage',
+])
+@pytest.mark.django_db
+def test_cart_id_independent_of_storage(settings, user, auth_token, product,
+                                        storage):
+    """
+    Проверяет, что /api/cart/ возвращает id корзины из базы при любом
+    хранилище и после сохранения и удаления корзины.
+    """
+    settings.CART_STORAGE = storage
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + auth_token)
+    client.post(reverse('api:cart-add'), {'product_id': product.pk})
+
+    cart_id = client.get(reverse('api:cart-list')).json()['id']
+    assert cart_id == Cart.objects.get(user=user).pk
+    call_command('flush_carts', stdout=StringIO())
+    assert client.get(reverse('api:cart-list')).json()['id'] == cart_id
+
+    import_string(storage)(user=user).discard()
+    cart_id = client.get(reverse('api:cart-list')).json()['id']
+    assert cart_id == Cart.objects.get(user=user).pk
+
+
+@pytest.mark.parametrize('storage', [
+    'api.cart_storage.DatabaseCartStorage',
+    'api.cart_storage.CacheCartStorage',
+])
+@pytest.mark.django_db
+def test_guest_cart_merged_on_login(settings, user, product, category,
+                                    subcategory, storage):
+    """
+    Проверяет, что гостевая корзина хранится в сессии посетителя и при
+    получении токена переносится в корзину пользователя: количества
+    одинаковых товаров складываются, гостевая корзина удаляется.
+    """
+    settings.CART_STORAGE = storage
+    other = Product.objects.create(
+        name='Other', slug='other', category=category,
+        subcategory=subcategory, price=5, image='products/default.jpg'
+    )
+    import_string(storage)(user=user).add({product.pk: 1})
+
+    client = APIClient()
+    response = client.post(reverse('api:cart-batch'), {'operations': [
+        {'op': 'add', 'product_id': product.pk, 'quantity': 2},
+        {'op': 'add', 'product_id': other.pk, 'quantity': 4},
+    ]}, format='json')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['total_quantity'] == 6
+    assert client.get(reverse('api:cart-list')).data['total_quantity'] == 6
+
+    response = client.post(reverse('api:login'), {
+        'username': 'testuser', 'password': 'password'
+    })
+    assert response.status_code == status.HTTP_200_OK
+
+    client.credentials(
+        HTTP_AUTHORIZATION='Token ' + response.data['auth_token']
+    )
+    response = client.get(reverse('api:cart-list'))
+    assert {
+        item['product']['id']: item['quantity']
+        for item in response.data['items']
+    } == {product.pk: 3, other.pk: 4}
+
+    client.credentials()
+    assert client.get(reverse('api:cart-list')).data['items'] == []
+    assert not Cart.objects.filter(guest_key__isnull=False).exists()
+
+
+@pytest.mark.parametrize('storage', [
+    'api.cart_storage.DatabaseCartStorage',
+    'api.cart_storage.CacheCartStorage',
+])
+@pytest.mark.django_db
+def test_purge_guest_carts(settings, user, product, storage):
+    """
+    Проверяет, что purge_guest_carts удаляет только гостевые корзины,
+    не изменявшиеся дольше срока жизни сессии, вместе с их кэшем, а
+    изменение корзины продлевает ее жизнь.
+    """
+    settings.CART_STORAGE = storage
+    storage_class = import_string(storage)
+    for owner in ({'guest_key': 'old'}, {'guest_key': 'fresh'},
+                  {'user': user}):
+        storage_class(**owner).add({product.pk: 1})
+    call_command('flush_carts', stdout=StringIO())
+    old = timezone.now() - timedelta(seconds=settings.SESSION_COOKIE_AGE + 1)
+    Cart.objects.exclude(guest_key='fresh').update(updated_at=old)
+
+    output = StringIO()
+    call_command('purge_guest_carts', stdout=output)
+    assert 'Удалено гостевых корзин: 1' in output.getvalue()
+    assert set(Cart.objects.values_list('guest_key', flat=True)) == {
+        'fresh', None
+    }
+    assert storage_class(guest_key='old').quantities() == {}
+    assert storage_class(guest_key='fresh').quantities() == {product.pk: 1}
+
+    Cart.objects.filter(guest_key='fresh').update(updated_at=old)
+    storage_class(guest_key='fresh').add({product.pk: 1})
+    call_command('purge_guest_carts', stdout=StringIO())
+    assert Cart.objects.filter(guest_key='fresh').exists()
+
+
+@pytest.mark.django_db
+def test_sqlite_connection_tuning():
+    """
+    Проверяет, что настройки профиля SQLite применяются к каждому новому
+    соединению: synchronous=NORMAL, ожидание блокировки и BEGIN IMMEDIATE.
+    """
+    if connection.vendor != 'sqlite':
+        pytest.skip('Профиль SQLite не используется.')
+    with connection.cursor() as cursor:
+        assert cursor.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert cursor.execute('PRAGMA busy_timeout').fetchone()[0] == (
+            settings.DATABASES['default']['OPTIONS']['timeout'] * 1000
+        )
+    assert connection.transaction_mode == 'IMMEDIATE'
+
+
+@pytest.mark.django_db
+def test_catalog_queries_use_indexes(category, subcategory, product):
+    """
+    Проверяет по EXPLAIN, что основные запросы каталога (фильтр по
+    категории и диапазону цены, подкатегория, сортировки по цене и
+    названию) читают таблицу продуктов по индексу, а не полным просмотром
+    и без отдельной сортировки.
+    """
+    queries = {
+        'category + price range': Product.objects.filter(
+            category=category, price__gte=1, price__lte=100
+        ).order_by('price', 'id'),
+        'subcategory': Product.objects.filter(
+            subcategory=subcategory
+        ).order_by('id'),
+        'price range': Product.objects.filter(
+            price__gte=1, price__lte=100
+        ).order_by('price', 'id'),
+        'order by price': Product.objects.order_by('-price', '-id'),
+        'order by name': Product.objects.order_by('name', 'id'),
+    }
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        full_scan, sort = 'Seq Scan on products_product', 'Sort  (cost'
+    elif connection.vendor == 'sqlite':
+        full_scan, sort = 'SCAN products_product\n', 'USE TEMP B-TREE'
+    else:
+        pytest.skip('EXPLAIN проверяется только для SQLite и PostgreSQL.')
+
+    for title, queryset in queries.items():
+        plan = queryset[:20].explain() + '\n'
+        assert full_scan not in plan, f'{title}: {plan}'
+        assert sort not in plan, f'{title}: {plan}'
+
+
+@pytest.mark.django_db
+def test_product_filters_and_ordering(client, category, subcategory):
+    """
+    Проверяет фильтры списка продуктов по слагам и диапазону цены и
+    сортировку с однозначным порядком при равных значениях.
+    """
+    other_category = Category.objects.create(
+        name='Other', slug='other', image='categories/category_default.jpg'
+    )
+    other_subcategory = Subcategory.objects.create(
+        name='Other', slug='other-sub', category=other_category,
+        image='subcategories/subcategory_default.jpg'
+    )
+    for index, price in enumerate((30, 10, 20, 10)):
+        Product.objects.create(
+            name=f'Product {index}', slug=f'product-{index}',
+            category=category, subcategory=subcategory, price=price,
+            image='products/default.jpg'
+        )
+    Product.objects.create(
+        name='Foreign', slug='foreign', category=other_category,
+        subcategory=other_subcategory, price=15,
+        image='products/default.jpg'
+    )
+    url = reverse('api:product-list')
+
+    def names(**params):
+        response = client.get(url, {'page_size': 10, **params})
+        assert response.status_code == status.HTTP_200_OK
+        return [item['name'] for item in response.json()['results']]
+
+    assert names(category='other') == ['Foreign']
+    assert names(subcategory='test-subcategory', ordering='price') == [
+        'Product 1', 'Product 3', 'Product 2', 'Product 0'
+    ]
+    assert names(min_price='12', max_price='20', ordering='-price') == [
+        'Product 2', 'Foreign'
+    ]
+    assert names(category='missing') == []
+    assert client.get(url, {'min_price': 'cheap'}).status_code == (
+        status.HTTP_400_BAD_REQUEST
+    )
+
+    response = client.get(
+        url, {'pagination': 'cursor', 'page_size': 2, 'ordering': '-price'}
+    )
+    first = [item['name'] for item in response.json()['results']]
+    response = client.get(response.json()['next'])
+    second = [item['name'] for item in response.json()['results']]
+    assert first + second == ['Product 0', 'Product 2', 'Foreign',
+                              'Product 3']
+
+
+@pytest.mark.django_db
+def test_product_search(client, category, subcategory,
+                        django_assert_num_queries,
+                        django_capture_on_commit_callbacks):
+    """
+    Проверяет поиск по словам названия с сопоставлением по префиксу и
+    обновление индекса при сохранении, удалении и массовом импорте.
+    """
+    milk = Product.objects.create(
+        name='Молоко пастеризованное', slug='milk', category=category,
+        subcategory=subcategory, price=80, image='products/default.jpg'
+    )
+    Product.objects.create(
+        name='Кефир', slug='kefir', category=category,
+        subcategory=subcategory, price=90, image='products/default.jpg'
+    )
+    url = reverse('api:product-list')
+
+    def names(text):
+        response = client.get(url, {'search': text})
+        assert response.status_code == status.HTTP_200_OK
+        return [item['name'] for item in response.json()['results']]
+
+    assert names('молок') == ['Молоко пастеризованное']
+    assert names('пастер МОЛОКО') == ['Молоко пастеризованное']
+    assert names('молоко кефир') == []
+    assert names('"') == ['Молоко пастеризованное', 'Кефир']
+
+    milk.name = 'Молоко топленое'
+    with django_capture_on_commit_callbacks(execute=True):
+        milk.save()
+    assert names('топлен') == ['Молоко топленое']
+    assert names('пастер') == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        milk.delete()
+    assert names('молок') == []
+
+    Product.objects.bulk_create([Product(
+        name='Молоко козье', slug='goat-milk', category=category,
+        subcategory=subcategory, price=150, image='products/default.jpg'
+    )])
+    with django_capture_on_commit_callbacks(execute=True):
+        catalog_changed.send(sender=Product)
+    get_last_modified((Product, Category, Subcategory))
+    with django_assert_num_queries(3):
+        assert names('коз') == ['Молоко козье']
+
+
+@pytest.mark.django_db
+def test_category_slug_lookup(client, category, subcategory, product,
+                              django_assert_num_queries):
+    """
+    Проверяет, что категория по слагу отдается из дерева категорий без
+    запросов, кроме версий таблиц, а ее продукты — запросами COUNT и
+    выборки с JOIN.
+    """
+    Product.objects.create(
+        name='Second', slug='second', category=category,
+        subcategory=subcategory, price=5, image='products/default.jpg'
+    )
+    other = Category.objects.create(
+        name='Other', slug='other', image='categories/category_default.jpg'
+    )
+    category_tree.get_categories()
+    get_last_modified((Product, Category, Subcategory))
+
+    with django_assert_num_queries(1):
+        response = client.get(
+            reverse('api:category-detail', kwargs={'pk': category.slug})
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['id'] == category.pk
+
+    url = reverse('api:category-products', kwargs={'pk': category.slug})
+    with django_assert_num_queries(3):
+        response = client.get(url, {'ordering': 'price'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['count'] == 2
+    assert [item['slug'] for item in response.json()['results']] == [
+        'second', product.slug
+    ]
+
+    response = client.get(
+        reverse('api:category-products', kwargs={'pk': other.slug})
+    )
+    assert response.json()['count'] == 0
+    response = client.get(
+        reverse('api:category-products', kwargs={'pk': 'missing'})
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize('value', ['²', '٣', '9' * 30])
+@pytest.mark.parametrize('name', ['api:category-detail', 'api:product-detail'])
+@pytest.mark.django_db
+def test_non_ascii_digit_lookup(client, product, name, value):
+    """
+    Проверяет, что значения из цифр вне ASCII и слишком большие числа
+    ищутся как слаги и дают 404, а не ошибку сервера.
+    """
+    response = client.get(reverse(name, kwargs={'pk': value}))
+    assert response.status_code == status.HTTP_404_NOT_FOUND
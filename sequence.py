@@ -1,23 +1,150 @@
+import sys
+from itertools import chain, count, islice, repeat
+from math import isqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_SIZE = 65536
+ARRAY_DTYPES = ('uint8', 'uint16', 'uint32', 'uint64')
+
+
+def nth(k):
+    """
+    Возвращает элемент последовательности 1, 2, 2, 3, 3, 3, ... с индексом
+    k (с нуля) за O(1).
+
+    Число m заканчивается на позиции m * (m + 1) / 2 (треугольное число),
+    поэтому элемент — наименьшее m, для которого это число больше k.
+    """
+    if k < 0:
+        raise IndexError('Индекс должен быть неотрицательным.')
+    return (isqrt(8 * k + 1) + 1) // 2
+
+
+def iter_sequence(start=0, stop=None):
+    """
+    Лениво выдает элементы последовательности с индексами от start до stop
+    (не включая stop; без stop — бесконечно), используя O(1) памяти.
+    """
+    if start < 0:
+        raise IndexError('Индекс должен быть неотрицательным.')
+    number = nth(start)
+    first_run = number * (number + 1) // 2 - start
+    runs = (
+        repeat(value, value if value > number else first_run)
+        for value in count(number)
+    )
+    values = chain.from_iterable(runs)
+    if stop is None:
+        return values
+    return islice(values, max(stop - start, 0))
+
+
+def sequence_slice(start, stop, step=1):
+    """Возвращает итератор по элементам sequence[start:stop:step]."""
+    if step <= 0:
+        raise ValueError('Шаг должен быть положительным.')
+    if step == 1:
+        return iter_sequence(start, stop)
+    return (nth(index) for index in range(start, stop, step))
+
+
 def generate_sequence(n):
-    sequence = []
-    number = 1
-    while len(sequence) < n:
-        sequence.extend([number] * number)
-        number += 1
-    return sequence[:n]
+    """Возвращает первые n элементов последовательности списком."""
+    return list(iter_sequence(0, n))
 
 
-try:
-    n = input('Введите количество элементов: ')
-    if not n.isdigit() or int(n) <= 0:
-        raise ValueError(
-            'Введено некорректное значение.'
-            'Пожалуйста, введите положительное целое число.'
+def run_lengths(n):
+    """
+    Возвращает первые n элементов в виде пар (значение, число повторов).
+
+    Размер результата — O(√n): каждое значение образует одну пару, а
+    последняя пара может быть неполной.
+    """
+    if n <= 0:
+        return []
+    last = nth(n - 1)
+    runs = [(value, value) for value in range(1, last)]
+    runs.append((last, n - last * (last - 1) // 2))
+    return runs
+
+
+def expand_runs(runs):
+    """Лениво разворачивает пары (значение, число повторов) в элементы."""
+    return chain.from_iterable(repeat(value, times) for value, times in runs)
+
+
+def sequence_array(n, dtype=None, path=None):
+    """
+    Возвращает первые n элементов массивом NumPy.
+
+    По умолчанию выбирается наименьший беззнаковый тип, вмещающий
+    наибольшее значение (для n = 10**9 — uint16, 2 байта на элемент).
+    Если указан path, массив создается как отображаемый в память файл
+    .npy и заполняется блоками по CHUNK_SIZE элементов, поэтому
+    оперативная память не зависит от n. Требует пакет numpy.
+    """
+    if np is None:
+        raise ImportError('Для sequence_array нужен пакет numpy.')
+    if n <= 0:
+        return np.empty(0, dtype=dtype or ARRAY_DTYPES[0])
+    last = nth(n - 1)
+    if dtype is None:
+        dtype = next(
+            name for name in ARRAY_DTYPES if last <= np.iinfo(name).max
         )
+    if path is None:
+        values = np.arange(1, last + 1, dtype=dtype)
+        counts = values.astype(np.int64)
+        counts[-1] = n - last * (last - 1) // 2
+        return np.repeat(values, counts)
+
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                      shape=(n,))
+    # Блок — элементы с индексами [begin, end). Значение m занимает
+    # индексы [m * (m - 1) / 2, m * (m + 1) / 2), поэтому число его
+    # повторов в блоке — пересечение этих отрезков.
+    for begin in range(0, n, CHUNK_SIZE):
+        end = min(begin + CHUNK_SIZE, n)
+        values = np.arange(nth(begin), nth(end - 1) + 1, dtype=np.int64)
+        starts = values * (values - 1) // 2
+        counts = (np.minimum(starts + values, end)
+                  - np.maximum(starts, begin))
+        array[begin:end] = np.repeat(values, counts)
+    array.flush()
+    return array
+
+
+def write_sequence(n, file=sys.stdout, chunk_size=CHUNK_SIZE):
+    """
+    Печатает первые n элементов в формате списка Python, формируя вывод
+    частями по chunk_size элементов, а не одной строкой на всю
+    последовательность.
+    """
+    values = iter_sequence(0, n)
+    file.write('[')
+    separator = ''
+    while chunk := list(islice(values, chunk_size)):
+        file.write(separator + ', '.join(map(str, chunk)))
+        separator = ', '
+    file.write(']\n')
+
+
+if __name__ == '__main__':
+    try:
+        n = input('Введите количество элементов: ')
+        if not n.isdigit() or int(n) <= 0:
+            raise ValueError(
+                'Введено некорректное значение.'
+                'Пожалуйста, введите положительное целое число.'
+            )
 
-    n = int(n)
-    result = generate_sequence(n)
-    print('Последовательность:', result)
+        n = int(n)
+        print('Последовательность: ', end='')
+        write_sequence(n)
 
-except ValueError as e:
-    print('Ошибка:', e)
+    except ValueError as e:
+        print('Ошибка:', e)
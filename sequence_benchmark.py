@@ -0,0 +1,134 @@
+"""
+Бенчмарк способов получить первые n элементов sequence.py.
+
+Сравниваются исходная реализация списком через extend, список
+(generate_sequence), генератор (iter_sequence),
+run-length кодирование (run_lengths) и NumPy (sequence_array в памяти и в
+отображаемом в память файле .npy) для n от 10**3 до 10**9. Для каждого
+способа выводится время и, с ключом --memory, пик выделенной памяти по
+tracemalloc. Способы, для которых n больше их предела, пропускаются.
+
+Запуск: python sequence_benchmark.py [--max-n 1000000000] [--memory]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+import sequence
+
+SIZES = [10 ** power for power in range(3, 10)]
+
+
+def original_sequence(n):
+    """Исходная реализация generate_sequence через список."""
+    values = []
+    number = 1
+    while len(values) < n:
+        values.extend([number] * number)
+        number += 1
+    return values[:n]
+
+
+def consume_original(n):
+    return len(original_sequence(n))
+
+
+def consume_list(n):
+    return len(sequence.generate_sequence(n))
+
+
+def consume_generator(n):
+    deque(sequence.iter_sequence(0, n), maxlen=0)
+    return n
+
+
+def consume_runs(n):
+    return sum(times for _, times in sequence.run_lengths(n))
+
+
+def consume_array(n):
+    return len(sequence.sequence_array(n))
+
+
+def consume_memmap(n):
+    descriptor, path = tempfile.mkstemp(suffix='.npy')
+    os.close(descriptor)
+    try:
+        array = sequence.sequence_array(n, path=path)
+        length = len(array)
+        del array
+        return length
+    finally:
+        os.remove(path)
+
+
+# Способ, функция и наибольшее n, при котором он запускается по умолчанию.
+BACKENDS = [
+    ('original', consume_original, 10 ** 7),
+    ('list', consume_list, 10 ** 7),
+    ('generator', consume_generator, 10 ** 8),
+    ('rle', consume_runs, 10 ** 9),
+    ('numpy', consume_array, 10 ** 9),
+    ('numpy-memmap', consume_memmap, 10 ** 9),
+]
+
+
+def measure(consume, n, memory):
+    started = time.perf_counter()
+    length = consume(n)
+    elapsed = time.perf_counter() - started
+    if length != n:
+        raise RuntimeError(f'Получено {length} элементов вместо {n}.')
+    if not memory:
+        return elapsed, None
+    tracemalloc.start()
+    try:
+        consume(n)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def format_result(result):
+    if result is None:
+        return '-'
+    elapsed, peak = result
+    text = f'{elapsed * 1000:.1f} ms'
+    if peak is not None:
+        text += f' / {peak / 2 ** 20:.1f} MiB'
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--max-n', type=int, default=SIZES[-1],
+                        help='Наибольшее n.')
+    parser.add_argument('--memory', action='store_true',
+                        help='Измерять пик памяти (повторный запуск).')
+    args = parser.parse_args()
+
+    backends = [
+        backend for backend in BACKENDS
+        if sequence.np is not None or not backend[0].startswith('numpy')
+    ]
+    if len(backends) < len(BACKENDS):
+        print('numpy не установлен, способы numpy пропущены.')
+
+    width = 24
+    print(f'{"n":>12}' + ''.join(f'{name:>{width}}'
+                                 for name, _, _ in backends))
+    for n in (size for size in SIZES if size <= args.max_n):
+        results = [
+            measure(consume, n, args.memory) if n <= limit else None
+            for _, consume, limit in backends
+        ]
+        print(f'{n:>12}' + ''.join(f'{format_result(result):>{width}}'
+                                   for result in results), flush=True)
+
+
+if __name__ == '__main__':
+    main()
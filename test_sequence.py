@@ -0,0 +1,70 @@
+from io import StringIO
+from itertools import islice
+
+import pytest
+
+import sequence
+
+N = 40
+
+
+def reference(n):
+    """Исходная реализация generate_sequence через список."""
+    values = []
+    number = 1
+    while len(values) < n:
+        values.extend([number] * number)
+        number += 1
+    return values[:n]
+
+
+EXPECTED = reference(N)
+
+
+def test_nth():
+    assert [sequence.nth(k) for k in range(N)] == EXPECTED
+    with pytest.raises(IndexError):
+        sequence.nth(-1)
+
+
+def test_nth_large_index():
+    k = 10 ** 18
+    value = sequence.nth(k)
+    assert (value - 1) * value // 2 <= k < value * (value + 1) // 2
+
+
+@pytest.mark.parametrize('n', range(N + 1))
+def test_generate_sequence(n):
+    assert sequence.generate_sequence(n) == EXPECTED[:n]
+
+
+def test_iter_sequence():
+    for start in range(N + 1):
+        assert list(islice(sequence.iter_sequence(start), N - start)) == (
+            EXPECTED[start:]
+        )
+        for stop in range(N + 1):
+            assert list(sequence.iter_sequence(start, stop)) == (
+                EXPECTED[start:stop]
+            )
+    with pytest.raises(IndexError):
+        sequence.iter_sequence(-1)
+
+
+def test_sequence_slice():
+    for start in range(N + 1):
+        for stop in range(N + 1):
+            for step in range(1, 6):
+                assert list(sequence.sequence_slice(start, stop, step)) == (
+                    EXPECTED[start:stop:step]
+                )
+    with pytest.raises(ValueError):
+        sequence.sequence_slice(0, N, 0)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1000])
+@pytest.mark.parametrize('n', [0, 1, 2, 10, N])
+def test_write_sequence(n, chunk_size):
+    output = StringIO()
+    sequence.write_sequence(n, file=output, chunk_size=chunk_size)
+    assert output.getvalue() == f'{EXPECTED[:n]}\n'
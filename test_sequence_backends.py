@@ -0,0 +1,50 @@
+import pytest
+
+import sequence
+from test_sequence import EXPECTED, N, reference
+
+
+@pytest.mark.parametrize('n', range(-1, N + 1))
+def test_run_lengths(n):
+    runs = sequence.run_lengths(n)
+    assert list(sequence.expand_runs(runs)) == EXPECTED[:max(n, 0)]
+    assert all(times > 0 for _, times in runs)
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 10, N])
+def test_sequence_array(n, tmp_path):
+    np = pytest.importorskip('numpy')
+    array = sequence.sequence_array(n)
+    assert array.tolist() == EXPECTED[:n]
+    assert array.dtype == np.uint8
+
+    path = tmp_path / 'sequence.npy'
+    mapped = sequence.sequence_array(n, dtype='uint32', path=path)
+    assert mapped.dtype == np.uint32
+    assert mapped.tolist() == EXPECTED[:n]
+    if n:
+        assert np.load(path).tolist() == EXPECTED[:n]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 8, 100])
+def test_sequence_array_memmap_chunks(tmp_path, monkeypatch, chunk_size):
+    """
+    Проверяет заполнение файла блоками: каждый блок не больше CHUNK_SIZE
+    элементов, в том числе когда одно значение повторяется дольше блока.
+    """
+    np = pytest.importorskip('numpy')
+    monkeypatch.setattr(sequence, 'CHUNK_SIZE', chunk_size)
+    repeat = np.repeat
+    sizes = []
+
+    def counting_repeat(*args, **kwargs):
+        result = repeat(*args, **kwargs)
+        sizes.append(len(result))
+        return result
+
+    monkeypatch.setattr(np, 'repeat', counting_repeat)
+    n = 1000
+    array = sequence.sequence_array(n, path=tmp_path / 'sequence.npy')
+    assert array.tolist() == reference(n)
+    assert max(sizes) <= chunk_size
+    assert sum(sizes) == n